@@ -1,18 +1,30 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+import asyncio
+import json
 from app.enigma.machine import EnigmaMachine
-from ..enigma.components import Plugboard
+from app.enigma import batch
+from app.enigma.stream import StreamEncryptor
+from ..enigma.components import Plugboard, ROTOR_WIRINGS, REFLECTOR_WIRINGS
 import logging
 from .challenges import CHALLENGES
 from .sources import get_challenge_sources
+from .jobs import KEYS_PER_SEARCH_TASK, JobManager, challenge_tasks, rotor_search_tasks
+from .machine_cache import MachineCache
+from .offload import OffloadBusy, Offloader
+from .sessions import SESSION_COOKIE, SESSION_HEADER, SESSION_TTL, create_session_backend, new_token, valid_token
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-machine = EnigmaMachine()
+sessions = create_session_backend()
+machine_cache = MachineCache()
+jobs = JobManager()
+offloader = Offloader()
 
 class RotorSettings(BaseModel):
     name: str
@@ -32,6 +44,37 @@ class MachineSettings(BaseModel):
 class Message(BaseModel):
     text: str
 
+class SettingsMessage(BaseModel):
+    settings: MachineSettings
+    text: str
+
+class BatchRequest(BaseModel):
+    items: List[SettingsMessage]
+
+class BatchResult(BaseModel):
+    encrypted: Optional[str] = None
+    error: Optional[str] = None
+
+# Limits for /encrypt/batch: every text is padded to the longest one in the batch
+MAX_BATCH_ITEMS = 1000
+MAX_BATCH_TEXT_LENGTH = 10000  # Characters per item
+MAX_BATCH_TOTAL_LENGTH = 1000000  # Characters over all items
+
+class JobRequest(BaseModel):
+    kind: str  # "rotor_search" or "challenge"
+    ciphertext: Optional[str] = None
+    challenge_id: Optional[int] = None
+    rotor_orders: Optional[List[List[str]]] = None
+    reflectors: Optional[List[str]] = None
+    ring_settings: List[int] = [0, 0, 0]
+    plugboard: Dict[str, str] = {}
+    top_k: int = 10
+
+# Limits for cracking jobs
+MAX_JOB_CIPHERTEXT = 1000  # A few hundred letters pin down the key; memory per task grows with length
+MAX_JOB_TOP_K = 100
+JOB_EVENT_INTERVAL = 15  # Seconds between progress events when nothing changes
+
 class ChallengeResponse(BaseModel):
     id: int
     ciphertext: str
@@ -40,20 +83,56 @@ class ChallengeResponse(BaseModel):
     settings_public: Optional[PublicSettings] = None
     sources: Optional[Dict[str, Any]] = None
 
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse for generators that consume the request body themselves.
+
+    StreamingResponse normally listens for the client disconnect on ``receive``
+    while streaming, which would steal the body chunks the generator is reading.
+    Here the generator owns ``receive``; a disconnect surfaces as ClientDisconnect
+    from ``request.stream()`` instead.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def session_token(request: Request, response: Response) -> str:
+    """Return the client's session token, issuing a new one if it has none."""
+    token = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not valid_token(token):
+        token = new_token()
+    _attach_token(response, token)
+    return token
+
+def _attach_token(response: Response, token: str):
+    response.set_cookie(SESSION_COOKIE, token, max_age=SESSION_TTL, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = token
+
+def load_machine(token: str) -> EnigmaMachine:
+    """Build the client's machine from its stored settings (unconfigured if none)."""
+    machine = EnigmaMachine()
+    settings = sessions.get(token)
+    if settings and settings.get("rotors"):
+        machine.apply_settings(settings)
+    return machine
+
+def save_machine(token: str, machine: EnigmaMachine):
+    """Store the machine's current settings (including rotor positions) for the client."""
+    sessions.set(token, machine.get_current_settings())
+
 def normalize_solution(s):
     return ''.join(c for c in s.upper() if c.isalpha())
 
 @router.post("/settings")
-async def set_settings(settings: MachineSettings):
+async def set_settings(settings: MachineSettings, token: str = Depends(session_token)):
     """Set up the Enigma machine with the provided settings."""
     try:
         logger.info(f"Received settings request: {settings}")
-        
+        machine = EnigmaMachine()
+
         # Clear existing configuration if rotors are empty
         if not settings.rotors:
-            machine.rotors = []
-            machine.reflector = None
-            machine.plugboard = Plugboard()
+            sessions.delete(token)
             return {"status": "success", "settings": machine.get_current_settings()}
 
         # Validate rotor count
@@ -79,17 +158,19 @@ async def set_settings(settings: MachineSettings):
                 # This exception should now be raised if add_connection returns False
                 raise HTTPException(status_code=400, detail=f"Invalid plugboard connection: {char1}-{char2}")
 
+        save_machine(token, machine)
         return {"status": "success", "settings": machine.get_current_settings()}
     except Exception as e:
         logger.error(f"Error in set_settings: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/encrypt")
-async def encrypt_message(message: Message):
+async def encrypt_message(message: Message, token: str = Depends(session_token)):
     """Encrypt a message using the current Enigma machine settings."""
     try:
         logger.info(f"Received encrypt request: {message}")
-        
+        machine = load_machine(token)
+
         # Check if machine is configured
         if not machine.rotors or not machine.reflector:
             raise HTTPException(status_code=400, detail="Enigma machine not configured")
@@ -105,18 +186,138 @@ async def encrypt_message(message: Message):
             ring_settings=[r.ring_setting for r in machine.rotors]
         )
 
-        encrypted = machine.encrypt_message(message.text)
+        encrypted = await offloader.run(len(message.text), machine.encrypt_message, message.text)
+        save_machine(token, machine)
         return {
             "encrypted": encrypted,
             "settings": machine.get_current_settings()
         }
+    except OffloadBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error in encrypt_message: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/encrypt/stream")
+async def encrypt_stream(request: Request, token: str = Depends(session_token)):
+    """Encrypt a plain-text request body as it arrives and stream the ciphertext back.
+
+    The body is read chunk by chunk and each chunk is encrypted and sent as soon
+    as it is available, so memory per request stays bounded and a slow client
+    slows down reading of the body instead of buffering output.
+    """
+    machine = load_machine(token)
+
+    # Check if machine is configured
+    if not machine.rotors or not machine.reflector:
+        raise HTTPException(status_code=400, detail="Enigma machine not configured")
+
+    # Continue from the current rotor positions, like /encrypt
+    machine.set_rotors(
+        rotor_names=[r.name for r in machine.rotors],
+        positions=[r.current_position for r in machine.rotors],
+        ring_settings=[r.ring_setting for r in machine.rotors]
+    )
+    encryptor = StreamEncryptor(machine)
+    logger.info(f"Started streaming encryption with settings: {machine.get_current_settings()}")
+
+    async def encrypted_chunks():
+        async for chunk in encryptor.aiter_encrypt(request.stream()):
+            yield chunk
+        for rotor, position in zip(machine.rotors, encryptor.positions):
+            rotor.current_position = position
+        save_machine(token, machine)
+
+    response = BodyStreamingResponse(encrypted_chunks(), media_type="text/plain; charset=utf-8")
+    _attach_token(response, token)
+    return response
+
+@router.post("/encrypt/inline")
+async def encrypt_inline(message: SettingsMessage):
+    """Encrypt a message with settings given in the request, without any server state.
+
+    Machines are cached by a canonical hash of their settings, so repeated
+    encryptions under the same key reuse the compiled machine.
+    """
+    try:
+        key, (engine, positions) = machine_cache.get(
+            message.settings.model_dump(), lambda _: _machine_for(message.settings)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        encrypted, _ = await offloader.run(len(message.text), engine.encrypt_text, message.text, positions)
+    except OffloadBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"encrypted": encrypted, "settings_hash": key}
+
+@router.post("/encrypt/batch", response_model=List[BatchResult])
+async def encrypt_batch(request: BatchRequest):
+    """Encrypt many texts, each with its own full settings, in a single request.
+
+    Results are returned in request order. Invalid items get an error message
+    instead of failing the whole batch.
+    """
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items are allowed per batch")
+    if sum(len(item.text) for item in request.items) > MAX_BATCH_TOTAL_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Batch texts are limited to {MAX_BATCH_TOTAL_LENGTH} characters in total")
+    logger.info(f"Received batch encrypt request with {len(request.items)} items")
+
+    results = [BatchResult() for _ in request.items]
+    valid = []
+    rows = []
+    others = []  # (index, machine) of texts the batch engine cannot handle
+    for i, item in enumerate(request.items):
+        try:
+            if len(item.text) > MAX_BATCH_TEXT_LENGTH:
+                raise ValueError(f"Text is limited to {MAX_BATCH_TEXT_LENGTH} characters")
+            if not item.text.isascii():
+                # The batch engine handles ASCII only; use a machine for the rest
+                others.append((i, _machine_for(item.settings)))
+                continue
+            rows.append(batch.settings_arrays([item.settings.model_dump()]))
+            valid.append(i)
+        except Exception as e:
+            results[i].error = str(e)
+
+    if valid or others:
+        texts = [request.items[i].text for i in valid]
+        machines = [(machine, request.items[i].text) for i, machine in others]
+        work = sum(len(request.items[i].text) for i in valid + [i for i, _ in others])
+        try:
+            encrypted_texts = await offloader.run(work, _encrypt_batch_items, rows, texts, machines)
+        except OffloadBusy as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        for i, encrypted in zip(valid + [i for i, _ in others], encrypted_texts):
+            results[i].encrypted = encrypted
+    return results
+
+def _encrypt_batch_items(rows, texts: List[str], machines: List[Tuple[EnigmaMachine, str]]) -> List[str]:
+    """ASCII texts on the batch engine, then the rest on their own machines, in that order."""
+    encrypted = batch.encrypt_arrays(batch.stack_settings(rows), texts) if texts else []
+    return encrypted + [machine.encrypt_message(text) for machine, text in machines]
+
+def _machine_for(settings: MachineSettings) -> EnigmaMachine:
+    """Build a standalone machine for the given settings (raises ValueError if invalid)."""
+    item_machine = EnigmaMachine()
+    if len(settings.rotors) != 3 or not item_machine.set_rotors(
+        rotor_names=[r.name for r in settings.rotors],
+        positions=[r.position or 0 for r in settings.rotors],
+        ring_settings=[r.ring_setting or 0 for r in settings.rotors]
+    ):
+        raise ValueError("Invalid rotor configuration")
+    if not item_machine.set_reflector(settings.reflector):
+        raise ValueError("Invalid reflector")
+    for char1, char2 in settings.plugboard.items():
+        if not item_machine.add_plugboard_connection(char1, char2):
+            raise ValueError(f"Invalid plugboard connection: {char1}-{char2}")
+    return item_machine
+
 @router.get("/settings")
-async def get_settings():
+async def get_settings(token: str = Depends(session_token)):
     """Get the current settings of the Enigma machine."""
+    machine = load_machine(token)
     # Return empty settings if machine is not configured
     if not machine.rotors or not machine.reflector:
         return {
@@ -163,3 +364,88 @@ async def validate_solution(challenge_id: int, request: Request):
             correct = normalize_solution(user_solution) == normalize_solution(challenge["solution"])
             return {"correct": correct}
     raise HTTPException(status_code=404, detail="Challenge not found")
+
+@router.post("/jobs")
+async def submit_job(request: JobRequest, http_request: Request, token: str = Depends(session_token)):
+    """Start a cracking job in the background and return its id and progress."""
+    if not 1 <= request.top_k <= MAX_JOB_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {MAX_JOB_TOP_K}")
+    if request.ciphertext is not None and len(request.ciphertext) > MAX_JOB_CIPHERTEXT:
+        raise HTTPException(status_code=400, detail=f"Ciphertext is limited to {MAX_JOB_CIPHERTEXT} characters")
+
+    if request.kind == "rotor_search":
+        if not request.ciphertext:
+            raise HTTPException(status_code=400, detail="A ciphertext is required")
+        orders = request.rotor_orders
+        if orders is not None and any(len(o) != 3 or not set(o) <= set(ROTOR_WIRINGS) for o in orders):
+            raise HTTPException(status_code=400, detail="Invalid rotor order")
+        if request.reflectors is not None and not set(request.reflectors) <= set(REFLECTOR_WIRINGS):
+            raise HTTPException(status_code=400, detail="Invalid reflector")
+        if len(request.ring_settings) != 3:
+            raise HTTPException(status_code=400, detail="Exactly 3 ring settings are required")
+        try:
+            batch.plugboard_array(request.plugboard)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        tasks = rotor_search_tasks(request.ciphertext, orders, request.reflectors, request.ring_settings,
+                                   request.plugboard, request.top_k)
+        keys_per_task = KEYS_PER_SEARCH_TASK
+    elif request.kind == "challenge":
+        if not any(c["id"] == request.challenge_id for c in CHALLENGES):
+            raise HTTPException(status_code=404, detail="Challenge not found")
+        tasks = challenge_tasks(request.challenge_id, request.ciphertext)
+        keys_per_task = 0
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {request.kind}")
+
+    try:
+        client = http_request.client.host if http_request.client else "unknown"
+        job = jobs.submit(token, client, request.kind, tasks, keys_per_task, request.top_k)
+    except ValueError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    logger.info(f"Submitted {request.kind} job {job.id} with {len(tasks)} tasks")
+    return job.progress()
+
+def _owned_job(job_id: str, token: str):
+    job = jobs.get(job_id, token)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, token: str = Depends(session_token)):
+    """Current progress of a job (and its result once it is done)."""
+    return _owned_job(job_id, token).progress()
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, token: str = Depends(session_token)):
+    """Stream job progress as newline-delimited JSON until the job finishes."""
+    job = _owned_job(job_id, token)
+
+    async def events():
+        while True:
+            changed = job.changed
+            yield json.dumps(job.progress()) + "\n"
+            if job.finished_status:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=JOB_EVENT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, token: str = Depends(session_token)):
+    """Cancel a job; its remaining tasks are not run."""
+    job = _owned_job(job_id, token)
+    jobs.cancel(job)
+    return job.progress()
+
+@router.get("/metrics")
+async def metrics():
+    """Load of the request offload pool and the cracking job queue."""
+    return {
+        "offload": offloader.stats(),
+        "jobs": {"queue_depth": jobs.queue_depth(), "running": jobs.running},
+    }
@@ -0,0 +1,234 @@
+"""
+Background cracking jobs.
+
+A job is split into independent tasks (for a rotor search, one per rotor
+order and reflector) that run on a bounded process pool, so solvers never
+block the event loop. Free pool slots are handed out round-robin over the
+clients with pending work, and within a client in submission order, so a few
+heavy jobs cannot starve everybody else. Clients are identified by address,
+not by session token, since a client can get a fresh token on every request.
+Progress (keys tested, keys per second, best candidates so far) is updated as
+tasks finish; cancelling a job stops its remaining tasks from being scheduled,
+while tasks already on a worker keep their slot until they return.
+"""
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import time
+import uuid
+
+from app.cryptanalysis.challenge_solver import solve_challenge
+from app.cryptanalysis.rotor_search import Candidate, _search_task, push_top_k, rotor_orders
+from app.cryptanalysis.scoring import text_letters
+from app.enigma.batch import ALL_POSITIONS, REFLECTOR_NAMES
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_JOBS_PER_CLIENT = int(os.getenv("MAX_JOBS_PER_CLIENT", "3"))  # Queued or running
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "3600"))  # Seconds finished jobs stay available
+KEYS_PER_SEARCH_TASK = len(ALL_POSITIONS)
+
+Task = Tuple[Callable[..., Any], Tuple[Any, ...]]
+
+
+@dataclass
+class Job:
+    """One submitted job and its progress."""
+    id: str
+    owner: str  # Session token, for access to the job
+    client: str  # Client address, for the per-client limits
+    kind: str
+    tasks: List[Task]
+    keys_per_task: int
+    top_k: int = 10
+    status: str = "queued"  # queued, running, done, cancelled, failed
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    keys_tested: int = 0
+    tasks_done: int = 0
+    best: List[Candidate] = field(default_factory=list)  # Min-heap of the top_k candidates
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    next_task: int = 0
+    running: Dict[Future, int] = field(default_factory=dict)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def finished_status(self) -> bool:
+        return self.status in ("done", "cancelled", "failed")
+
+    def pending(self) -> bool:
+        return not self.finished_status and self.next_task < len(self.tasks)
+
+    def notify(self):
+        """Wake up everybody waiting for progress and arm a fresh event."""
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def progress(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "tasks_done": self.tasks_done,
+            "tasks_total": len(self.tasks),
+            "keys_tested": self.keys_tested,
+            "keys_total": self.keys_per_task * len(self.tasks),
+            "keys_per_second": self.keys_tested / elapsed if elapsed > 0 else 0.0,
+            "elapsed": elapsed,
+            "best": [{"score": c.score, "settings": c.settings()} for c in sorted(self.best, reverse=True)],
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Fair scheduler for job tasks on a bounded process pool."""
+
+    def __init__(self, workers: int = JOB_WORKERS, max_jobs_per_client: int = MAX_JOBS_PER_CLIENT,
+                 executor: Optional[Executor] = None):
+        self.workers = workers
+        self.max_jobs_per_client = max_jobs_per_client
+        self.jobs: Dict[str, Job] = {}
+        self._executor = executor
+        self._clients: Deque[str] = deque()  # Round-robin order of clients
+        self._running = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def submit(self, owner: str, client: str, kind: str, tasks: Sequence[Task], keys_per_task: int,
+               top_k: int = 10) -> Job:
+        """Queue a job; raises ValueError if the client already has too many unfinished jobs.
+
+        Jobs cancelled while tasks of theirs are still on a worker count as unfinished.
+        """
+        self._expire()
+        active = sum(1 for job in self.jobs.values() if job.client == client and (not job.finished_status or job.running))
+        if active >= self.max_jobs_per_client:
+            raise ValueError(f"At most {self.max_jobs_per_client} unfinished jobs are allowed per client")
+        job = Job(uuid.uuid4().hex, owner, client, kind, list(tasks), keys_per_task, top_k)
+        self.jobs[job.id] = job
+        if client not in self._clients:
+            self._clients.append(client)
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def cancel(self, job: Job):
+        """Stop scheduling the job's tasks.
+
+        Tasks still waiting in the pool are withdrawn; tasks already on a
+        worker run to the end (a process cannot be interrupted), keep their
+        slot until then and their results are ignored.
+        """
+        if job.finished_status:
+            return
+        for future in list(job.running):
+            future.cancel()
+        job.status = "cancelled"
+        job.finished = time.time()
+        job.notify()
+
+    @property
+    def running(self) -> int:
+        """Tasks currently on the pool."""
+        return self._running
+
+    def queue_depth(self) -> int:
+        """Tasks waiting for a pool slot, over all jobs."""
+        return sum(len(job.tasks) - job.next_task for job in self.jobs.values() if job.pending())
+
+    def _dispatch(self):
+        """Fill free pool slots, taking one task per client in turn."""
+        loop = asyncio.get_running_loop()
+        idle = 0
+        while self._running < self.workers and self._clients and idle < len(self._clients):
+            client = self._clients[0]
+            self._clients.rotate(-1)
+            job = next((j for j in self.jobs.values() if j.client == client and j.pending()), None)
+            if job is None:
+                idle += 1
+                continue
+            idle = 0
+            index = job.next_task
+            job.next_task += 1
+            if job.status == "queued":
+                job.status = "running"
+                job.started = time.time()
+            fn, args = job.tasks[index]
+            # The pool's own future, so the slot is released when the worker
+            # returns (or the task is withdrawn), not when someone stops waiting
+            future = self.executor.submit(fn, *args)
+            job.running[future] = index
+            self._running += 1
+            future.add_done_callback(lambda f, job=job: self._notify_loop(loop, job, f))
+        # Forget clients without pending work
+        self._clients = deque(c for c in self._clients if any(j.client == c and j.pending() for j in self.jobs.values()))
+
+    def _notify_loop(self, loop: asyncio.AbstractEventLoop, job: Job, future: Future):
+        """Pool callback (runs on a pool thread): hand the finished task to the event loop."""
+        try:
+            loop.call_soon_threadsafe(self._task_done, job, future)
+        except RuntimeError:
+            pass  # The event loop has shut down
+
+    def _task_done(self, job: Job, future: Future):
+        self._running -= 1
+        job.running.pop(future, None)
+        if not job.finished_status:
+            try:
+                self._collect(job, future.result())
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished = time.time()
+            if not job.finished_status and job.tasks_done == len(job.tasks):
+                job.status = "done"
+                job.finished = time.time()
+            job.notify()
+        self._dispatch()
+
+    def _collect(self, job: Job, result: Any):
+        job.tasks_done += 1
+        if isinstance(result, list):  # Candidates from a search task
+            job.keys_tested += job.keys_per_task
+            for candidate in result:
+                push_top_k(job.best, candidate, job.top_k)
+        else:  # A challenge Solution
+            job.keys_tested += sum(result.keys_tested.values())
+            job.result = {"settings": result.settings, "plaintext": result.plaintext,
+                          "score": result.score, "keys_tested": result.keys_tested}
+
+    def _expire(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id in [j.id for j in self.jobs.values() if j.finished_status and not j.running and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+
+def rotor_search_tasks(ciphertext: str, orders: Optional[Sequence[Sequence[str]]] = None,
+                       reflectors: Optional[Sequence[str]] = None,
+                       ring_settings: Sequence[int] = (0, 0, 0),
+                       plugboard: Optional[Dict[str, str]] = None, top_k: int = 10) -> List[Task]:
+    """One search task per rotor order and reflector, each covering all start positions."""
+    letters = text_letters(ciphertext)
+    return [
+        (_search_task, ((letters, tuple(order), reflector, tuple(ring_settings), None, plugboard, None, top_k),))
+        for order in (orders or rotor_orders())
+        for reflector in (reflectors or REFLECTOR_NAMES)
+    ]
+
+
+def challenge_tasks(challenge_id: int, ciphertext: Optional[str] = None) -> List[Task]:
+    return [(solve_challenge, (challenge_id, ciphertext))]
@@ -0,0 +1,94 @@
+"""
+LRU cache of ready-to-use machines for stateless encryption.
+
+Requests that carry their full settings are mapped to a canonical settings
+hash; the engine key and start positions for that hash are worked out once and
+reused, so repeated encryptions under the same key skip all setup work. Only
+the key is stored: the compiled engine (with its substitution cache of up to
+457 KB) is resolved through the bounded compile_config cache, so the two caches
+never hold more engines than ENIGMA_ENGINE_CACHE_SIZE.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Tuple
+import hashlib
+import json
+import os
+import threading
+
+from app.enigma.batch import settings_arrays
+from app.enigma.engine import CompiledEnigma, EngineKey, Positions, compile_config, config_key
+from app.enigma.machine import EnigmaMachine
+
+MACHINE_CACHE_SIZE = int(os.getenv("MACHINE_CACHE_SIZE", "256"))
+
+CachedMachine = Tuple[CompiledEnigma, Positions]
+CachedKey = Tuple[EngineKey, Positions]
+
+
+def canonical_settings(settings: Mapping[str, Any]) -> str:
+    """Serialize settings so that equivalent settings give the same string.
+
+    Positions and ring settings are reduced modulo 26, letters are upper-cased
+    and plugboard pairs are listed once each, in sorted order.
+    """
+    pairs = set()
+    for a, b in (settings.get("plugboard") or {}).items():
+        a, b = a.upper(), b.upper()
+        pairs.add(min(a, b) + max(a, b))
+    canonical = {
+        "rotors": [
+            [r["name"], (r.get("position") or 0) % 26, (r.get("ring_setting") or 0) % 26]
+            for r in settings.get("rotors") or []
+        ],
+        "reflector": settings.get("reflector"),
+        "plugboard": sorted(pairs),
+    }
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+
+def settings_hash(settings: Mapping[str, Any]) -> str:
+    """SHA-256 of the canonical settings, used as the cache key."""
+    return hashlib.sha256(canonical_settings(settings).encode()).hexdigest()
+
+
+class MachineCache:
+    """Bounded LRU cache from settings hash to engine key and start positions."""
+
+    def __init__(self, max_entries: int = MACHINE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, settings: Mapping[str, Any], build: Callable[[Mapping[str, Any]], EnigmaMachine]) -> Tuple[str, CachedMachine]:
+        """Return (settings hash, cached machine), building the machine on a miss.
+
+        ``build`` turns settings into a configured EnigmaMachine and raises on
+        invalid settings; failed builds are not cached. Settings are validated
+        (ValueError) before the lookup, since canonicalization hides some
+        invalid forms, such as a plugboard pair listed in both directions.
+        """
+        settings_arrays([settings])
+        key = settings_hash(settings)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, (compile_config(entry[0]), entry[1])
+        machine = build(settings)
+        positions = machine.positions_after(0)
+        engine = machine.compiled()
+        engine_key = config_key(machine.rotors, machine.reflector, machine.plugboard)
+        entry = (engine_key, (positions[0], positions[1], positions[2]))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return key, (engine, entry[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
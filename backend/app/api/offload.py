@@ -0,0 +1,95 @@
+"""
+Size-based dispatch of CPU-heavy request work off the event loop.
+
+Handlers pass the amount of work (characters to encrypt) along with the
+function to call. Small jobs run inline, since a thread hop would cost more
+than the work. Larger ones go to a bounded thread pool, so /ping and every
+other cheap endpoint keep answering while they run. At most ``workers`` jobs
+run at a time and at most ``max_queue`` wait; beyond that requests are
+rejected with OffloadBusy (503) instead of piling up. The counters are
+exposed by the /metrics endpoint.
+"""
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+import asyncio
+import os
+
+OFFLOAD_THRESHOLD = int(os.getenv("OFFLOAD_THRESHOLD", "20000"))  # Work units run inline on the event loop
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+OFFLOAD_MAX_QUEUE = int(os.getenv("OFFLOAD_MAX_QUEUE", "32"))  # Jobs waiting for a worker before new ones are rejected
+
+T = TypeVar("T")
+
+
+class OffloadBusy(Exception):
+    """Raised when the offload queue is full."""
+
+
+class Offloader:
+    """Runs request work inline or on a bounded pool depending on its size."""
+
+    def __init__(self, workers: int = OFFLOAD_WORKERS, threshold: int = OFFLOAD_THRESHOLD,
+                 max_queue: int = OFFLOAD_MAX_QUEUE, executor: Optional[Executor] = None):
+        self.workers = workers
+        self.threshold = threshold
+        self.max_queue = max_queue
+        self._executor = executor
+        self._slots = asyncio.Semaphore(workers)
+        self.inline = 0
+        self.offloaded = 0
+        self.rejected = 0
+        self.running = 0
+        self.waiting = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="offload")
+        return self._executor
+
+    async def run(self, work: int, fn: Callable[..., T], *args: Any) -> T:
+        """Call ``fn(*args)``, on the pool if ``work`` reaches the threshold."""
+        if work < self.threshold:
+            self.inline += 1
+            return fn(*args)
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise OffloadBusy(f"Server busy: {self.waiting} requests are waiting for a worker")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.offloaded += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._finished()
+            raise
+        # The slot is held until the worker returns, even if the request is
+        # cancelled (client disconnect) while the function is still running
+        future.add_done_callback(lambda _: self._notify_loop(loop))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _notify_loop(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _finished(self):
+        self.running -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "threshold": self.threshold,
+            "workers": self.workers,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,194 @@
+"""
+Per-client session storage for Enigma machine settings.
+
+Each client is identified by a session token (cookie or X-Session-Token header)
+and its machine settings are kept in a pluggable backend, so several uvicorn
+workers or nodes can serve the same client. Only plain settings dicts are
+stored; machines are rebuilt from them per request (compiled engines are
+cached, so this is cheap).
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Protocol, Tuple
+import json
+import os
+import secrets
+import threading
+import time
+
+SESSION_COOKIE = "enigma_session"
+SESSION_HEADER = "X-Session-Token"
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))  # Seconds of inactivity before a session expires
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))  # In-memory backend limit
+MAX_TOKEN_LENGTH = 128
+
+
+class SessionBackend(Protocol):
+    """Storage interface for session data."""
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def set(self, token: str, data: Dict[str, Any]) -> None:
+        ...
+
+    def delete(self, token: str) -> None:
+        ...
+
+
+class InMemorySessionBackend:
+    """Process-local backend with TTL expiry and least-recently-used eviction."""
+
+    def __init__(self, ttl: int = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries[token] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(token)
+            return data
+
+    def set(self, token: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(token)
+            self._evict()
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self):
+        """Drop expired sessions from the old end, then the oldest ones over the limit."""
+        now = time.monotonic()
+        while self._entries:
+            token, (expires, _) = next(iter(self._entries.items()))
+            if expires >= now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[token]
+
+
+class KeyValueClient(Protocol):
+    """The subset of the redis-py client API used by KeyValueSessionBackend."""
+
+    def get(self, name: str) -> Optional[bytes]:
+        ...
+
+    def set(self, name: str, value: str, ex: Optional[int] = None) -> Any:
+        ...
+
+    def expire(self, name: str, ttl: int) -> Any:
+        ...
+
+    def delete(self, name: str) -> Any:
+        ...
+
+
+class LocalKeyValueClient:
+    """In-process stand-in for a shared key-value store such as Redis."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name: str, value: str, ex: Optional[int] = None) -> bool:
+        if ex is not None and ex <= 0:
+            raise ValueError("invalid expire time in 'set' command")  # Same check as Redis
+        with self._lock:
+            expires = time.monotonic() + ex if ex is not None else None
+            self._data[name] = (expires, value.encode())
+            return True
+
+    def expire(self, name: str, ttl: int) -> bool:
+        """Set a key's TTL; like Redis, a TTL that is not positive deletes the key."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(name)
+            if entry is None or (entry[0] is not None and entry[0] < now):
+                self._data.pop(name, None)
+                return False
+            if ttl <= 0:
+                del self._data[name]
+            else:
+                self._data[name] = (now + ttl, entry[1])
+            return True
+
+    def delete(self, name: str) -> int:
+        with self._lock:
+            return 1 if self._data.pop(name, None) is not None else 0
+
+
+class KeyValueSessionBackend:
+    """Backend that keeps sessions as JSON in a shared key-value store.
+
+    Expiry is delegated to the store (``ex``), and every read refreshes the TTL
+    with EXPIRE rather than writing the value back, so a read never overwrites
+    a session another worker has just updated.
+    """
+
+    def __init__(self, client: KeyValueClient, ttl: int = SESSION_TTL, prefix: str = "enigma:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self.prefix + token)
+        if raw is None:
+            return None
+        self.client.expire(self.prefix + token, self.ttl)
+        return json.loads(raw)
+
+    def set(self, token: str, data: Dict[str, Any]) -> None:
+        self.client.set(self.prefix + token, json.dumps(data), ex=self.ttl)
+
+    def delete(self, token: str) -> None:
+        self.client.delete(self.prefix + token)
+
+
+def create_session_backend() -> SessionBackend:
+    """Create the backend selected by the SESSION_BACKEND environment variable.
+
+    ``memory`` (default) keeps sessions in this process. ``redis`` shares them
+    through the server at REDIS_URL (requires the optional ``redis`` package).
+    ``local`` uses the shared-store code path with an in-process stand-in.
+    """
+    kind = os.getenv("SESSION_BACKEND", "memory").lower()
+    if kind == "redis":
+        import redis  # Optional dependency, only needed for shared sessions
+        return KeyValueSessionBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    if kind == "local":
+        return KeyValueSessionBackend(LocalKeyValueClient())
+    return InMemorySessionBackend()
+
+
+def new_token() -> str:
+    """Generate a new random session token."""
+    return secrets.token_urlsafe(16)
+
+
+def valid_token(token: Optional[str]) -> bool:
+    """Check that a client-supplied token is usable as a storage key."""
+    return bool(token) and token.isascii() and len(token) <= MAX_TOKEN_LENGTH and token.replace("-", "").replace("_", "").isalnum()
@@ -0,0 +1,99 @@
+"""
+Banburismus: deciban scores for message pairs at relative offsets.
+
+Two messages enciphered on the same key stream, one shifted by d key presses
+against the other, show letter repeats at the plaintext rate (about 1 in 15)
+instead of the random rate (1 in 26). Turing scored each overlap in decibans:
+every repeat adds 10*log10(kappa / (1/26)) and every non-repeat adds
+10*log10((1 - kappa) / (25/26)), so the offsets with the highest totals are the
+most likely alignments.
+
+Repeat counts for all message pairs are computed together, with one array
+comparison per offset.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import math
+
+import numpy as np
+
+from app.enigma.batch import PAD
+from .cribs import letter_rows
+from .scoring import text_letters
+
+PLAIN_KAPPA = 0.0667  # Repeat rate of English plaintext (the index of coincidence)
+RANDOM_KAPPA = 1 / 26
+
+
+@dataclass(order=True)
+class OffsetHypothesis:
+    """Message ``second`` starting ``offset`` key presses after message ``first``."""
+    decibans: float
+    first: int
+    second: int
+    offset: int
+    repeats: int
+    overlap: int
+
+
+def repeat_counts(letters: np.ndarray, max_offset: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Repeats and overlap lengths for every ordered message pair and offset.
+
+    ``letters`` is an (M, L) matrix of letter indices padded with PAD. Entry
+    [i, j, d] compares letter t + d of message i with letter t of message j,
+    which lines them up if j starts d key presses after i. Returns two
+    (M, M, D) arrays: repeat counts and the number of letters compared.
+    """
+    letters = np.asarray(letters, dtype=np.uint8)
+    count, width = letters.shape
+    offsets = width if max_offset is None else min(width, max_offset + 1)
+    valid = letters != PAD
+    repeats = np.zeros((count, count, offsets), dtype=np.int32)
+    overlaps = np.zeros((count, count, offsets), dtype=np.int32)
+    for d in range(offsets):
+        left, right = letters[:, None, d:], letters[None, :, :width - d]
+        both = valid[:, None, d:] & valid[None, :, :width - d]
+        repeats[:, :, d] = ((left == right) & both).sum(axis=2)
+        overlaps[:, :, d] = both.sum(axis=2)
+    return repeats, overlaps
+
+
+def decibans(repeats: np.ndarray, overlaps: np.ndarray, kappa: float = PLAIN_KAPPA) -> np.ndarray:
+    """Weight of evidence in decibans that each overlap is on the same key stream."""
+    hit = 10 * math.log10(kappa / RANDOM_KAPPA)
+    miss = 10 * math.log10((1 - kappa) / (1 - RANDOM_KAPPA))
+    return repeats * hit + (overlaps - repeats) * miss
+
+
+def rank_offsets(ciphertexts: Sequence[str], top: int = 20, min_overlap: int = 20,
+                 max_offset: Optional[int] = None, kappa: float = PLAIN_KAPPA) -> List[OffsetHypothesis]:
+    """The ``top`` message pair offsets by deciban score, best first.
+
+    Only letters count (other characters are dropped), messages are not
+    paired with themselves and overlaps shorter than ``min_overlap`` are ignored.
+    """
+    width = max((len(text_letters(c)) for c in ciphertexts), default=0)
+    letters = letter_rows(ciphertexts, width, PAD)
+    repeats, overlaps = repeat_counts(letters, max_offset)
+    scores = decibans(repeats, overlaps, kappa)
+    count = len(ciphertexts)
+    scores[overlaps < min_overlap] = -np.inf
+    scores[np.arange(count), np.arange(count)] = -np.inf  # A message against itself
+    flat = scores.ravel()
+    k = min(top, int(np.isfinite(flat).sum()))
+    if not k:
+        return []
+    best = np.argpartition(flat, -k)[-k:]
+    hypotheses = []
+    for index in best:
+        i, j, d = np.unravel_index(index, scores.shape)
+        hypotheses.append(OffsetHypothesis(float(flat[index]), int(i), int(j), int(d),
+                                           int(repeats[i, j, d]), int(overlaps[i, j, d])))
+    return sorted(hypotheses, reverse=True)
+
+
+def challenge_ciphertexts() -> List[str]:
+    """The ciphertexts of all challenges, as a Banburismus corpus."""
+    from app.api.challenges import CHALLENGES
+    return [challenge["ciphertext"] for challenge in CHALLENGES]
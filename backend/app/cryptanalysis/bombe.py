@@ -0,0 +1,216 @@
+"""
+Turing-Welchman Bombe simulation for crib-based attacks.
+
+A crib (guessed plaintext) aligned against the ciphertext gives a menu: a
+graph whose nodes are letters and whose edges link each crib letter to its
+cipher letter, labelled with the key press at which they were enciphered.
+Since the plugboard is applied on both sides of the scrambler, a guess for the
+stecker partner of one menu letter implies the partners of its neighbours, and
+closed loops in the menu make wrong guesses contradict themselves.
+
+For one rotor order the Bombe tests all 17,576 start positions at once: the
+"live wires" (letter, stecker partner) are a (positions, 26, 26) boolean array,
+current flows along menu edges through the scrambler permutations and the
+diagonal board adds the symmetric wire (stecker is an involution). A position
+where the test register does not light up completely is a stop.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.enigma.batch import ALL_POSITIONS, REFLECTOR_NAMES, ROTOR_NAMES, scrambler_permutations
+from app.enigma.tables import shared_table
+from .rotor_search import RotorOrder, rotor_orders
+from .scoring import letters_text, text_letters
+
+Edge = Tuple[int, int, int]  # (crib letter, cipher letter, key press)
+
+
+@dataclass
+class Menu:
+    """Letter graph built from a crib placed at ``offset`` in the ciphertext."""
+    crib: str
+    offset: int
+    edges: List[Edge]
+
+    @property
+    def letters(self) -> List[int]:
+        return sorted({a for a, _, _ in self.edges} | {b for _, b, _ in self.edges})
+
+    @property
+    def test_letter(self) -> int:
+        """The best connected letter, used as the Bombe's test register."""
+        degree = np.bincount([x for a, b, _ in self.edges for x in (a, b)], minlength=26)
+        return int(np.argmax(degree))
+
+    def loops(self) -> List[List[int]]:
+        """A basis of closed loops in the menu (one per edge outside a spanning forest)."""
+        parent: Dict[int, Tuple[int, int]] = {}  # letter -> (parent letter, edge index)
+        depth: Dict[int, int] = {}
+        loops = []
+        adjacency: Dict[int, List[Tuple[int, int]]] = {}
+        for i, (a, b, _) in enumerate(self.edges):
+            adjacency.setdefault(a, []).append((b, i))
+            adjacency.setdefault(b, []).append((a, i))
+        tree_edges = set()
+        for root in adjacency:
+            if root in depth:
+                continue
+            depth[root] = 0
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                for neighbour, i in adjacency[node]:
+                    if neighbour not in depth:
+                        depth[neighbour] = depth[node] + 1
+                        parent[neighbour] = (node, i)
+                        tree_edges.add(i)
+                        stack.append(neighbour)
+        for i, (a, b, _) in enumerate(self.edges):
+            if i in tree_edges:
+                continue
+            left, right = [a], [b]
+            while left[-1] != right[-1]:
+                if depth[left[-1]] >= depth[right[-1]]:
+                    left.append(parent[left[-1]][0])
+                else:
+                    right.append(parent[right[-1]][0])
+            loops.append(left + right[-2::-1])
+        return loops
+
+
+@dataclass
+class Stop:
+    """A Bombe stop: a start position and the steckers it implies."""
+    rotors: RotorOrder
+    reflector: str
+    ring_settings: Tuple[int, int, int]
+    positions: Tuple[int, int, int]
+    test_letter: str
+    stecker: str  # Partner of the test letter
+    plugboard: Dict[str, str] = field(default_factory=dict)
+    consistent: bool = True  # No menu letter ended up with two partners
+
+    def settings(self) -> Dict:
+        """Settings in the format used by the API and CHALLENGES."""
+        return {
+            "rotors": [
+                {"name": name, "position": position, "ring_setting": ring}
+                for name, position, ring in zip(self.rotors, self.positions, self.ring_settings)
+            ],
+            "reflector": self.reflector,
+            "plugboard": dict(self.plugboard),
+        }
+
+
+def build_menu(crib: str, ciphertext: str, offset: int) -> Menu:
+    """Align a crib with the ciphertext letters starting at ``offset``.
+
+    Raises ValueError if the crib does not fit or a letter would encrypt to
+    itself, which the reflector makes impossible.
+    """
+    plain = text_letters(crib)
+    cipher = text_letters(ciphertext)[offset:offset + len(plain)]
+    if offset < 0 or len(cipher) < len(plain) or not len(plain):
+        raise ValueError("Crib does not fit in the ciphertext at this offset")
+    if (plain == cipher).any():
+        raise ValueError("Crib letter would encrypt to itself at this offset")
+    edges = [(int(a), int(b), offset + i) for i, (a, b) in enumerate(zip(plain, cipher))]
+    return Menu(letters_text(plain), offset, edges)
+
+
+def propagate(live: np.ndarray, edges: Sequence[Tuple[int, int]], perms: np.ndarray,
+              test_letter: Optional[int] = None) -> np.ndarray:
+    """Spread current through the menu and the diagonal board until nothing changes.
+
+    ``live`` is a (B, 26, 26) boolean array of live wires, ``edges`` are the
+    (a, b) letter pairs of the menu and ``perms`` the matching (B, E, 26)
+    scrambler permutations. If ``test_letter`` is given, rows whose test
+    register is fully lit are dropped from further work (they cannot stop).
+    """
+    active = np.arange(len(live))
+    while len(active):
+        state = live[active]
+        before = state.sum()
+        for k, (a, b) in enumerate(edges):
+            perm = perms[active, k].astype(np.intp)
+            # Scrambler permutations are involutions: a-x is live iff b-perm(x) is live
+            state[:, b] |= np.take_along_axis(state[:, a], perm, axis=1)
+            state[:, a] |= np.take_along_axis(state[:, b], perm, axis=1)
+        state |= state.transpose(0, 2, 1)  # Diagonal board
+        live[active] = state
+        if state.sum() == before:
+            break
+        if test_letter is not None:
+            active = active[state[:, test_letter].sum(axis=1) < 26]
+    return live
+
+
+def _closure(edges: Sequence[Tuple[int, int]], perms: np.ndarray, test_letter: int,
+             partners: np.ndarray, prune: bool = False) -> np.ndarray:
+    live = np.zeros((len(perms), 26, 26), dtype=bool)
+    live[np.arange(len(perms)), test_letter, partners] = True
+    return propagate(live, edges, perms, test_letter if prune else None)
+
+
+def run_order(menu: Menu, order: RotorOrder, reflector: str,
+              ring_settings: Sequence[int] = (0, 0, 0)) -> List[Stop]:
+    """Run the Bombe over all start positions for one rotor order and reflector."""
+    test = menu.test_letter
+    letter_pairs = [(a, b) for a, b, _ in menu.edges]
+    perms = scrambler_permutations(
+        [ROTOR_NAMES.index(name) for name in order], ring_settings,
+        REFLECTOR_NAMES.index(reflector), ALL_POSITIONS, [step for _, _, step in menu.edges],
+        table=shared_table(order, reflector)
+    )
+
+    # Energize one wire of the test register at every position
+    first_guess = (test + 1) % 26
+    live = _closure(letter_pairs, perms, test, np.full(len(perms), first_guess), prune=True)
+    lit = live[:, test]
+    counts = lit.sum(axis=1)
+
+    # If the guess was right only its own wire is lit; otherwise the right
+    # partner is among the dark wires of the test register
+    rows, partners = [], []
+    for row in np.flatnonzero(counts < 26):
+        guesses = [first_guess] if counts[row] == 1 else np.flatnonzero(~lit[row])
+        rows.extend([row] * len(guesses))
+        partners.extend(guesses)
+    if not rows:
+        return []
+    rows, partners = np.array(rows), np.array(partners)
+    checked = _closure(letter_pairs, perms[rows], test, partners)
+
+    stops = []
+    for row, partner, wires in zip(rows, partners, checked):
+        if wires[test].sum() != 1:
+            continue
+        per_letter = wires.sum(axis=1)
+        plugboard = {}
+        for a in menu.letters:
+            if per_letter[a] == 1:
+                b = int(np.argmax(wires[a]))
+                if a != b:
+                    first, second = sorted((a, b))
+                    plugboard[chr(first + ord('A'))] = chr(second + ord('A'))
+        stops.append(Stop(
+            rotors=tuple(order), reflector=reflector, ring_settings=tuple(int(r) for r in ring_settings),
+            positions=tuple(int(p) for p in ALL_POSITIONS[row]), test_letter=chr(test + ord('A')),
+            stecker=chr(int(partner) + ord('A')), plugboard=plugboard,
+            consistent=bool((per_letter[menu.letters] <= 1).all()),
+        ))
+    return stops
+
+
+def run_bombe(menu: Menu, orders: Optional[Iterable[RotorOrder]] = None,
+              reflectors: Optional[Iterable[str]] = None,
+              ring_settings: Sequence[int] = (0, 0, 0)) -> List[Stop]:
+    """Run the Bombe for every rotor order and reflector (all of them by default)."""
+    return [
+        stop
+        for order in (orders or rotor_orders())
+        for reflector in (reflectors or REFLECTOR_NAMES)
+        for stop in run_order(menu, order, reflector, ring_settings)
+    ]
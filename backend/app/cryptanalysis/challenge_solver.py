@@ -0,0 +1,183 @@
+"""
+Constrained solver for the challenges.
+
+Every challenge publishes part of its key in ``settings_public``: rotor names
+are always given, while positions, ring settings or the reflector may be None
+and the plugboard may list only some of the cables. Public fields are fixed
+constraints and only the remaining dimensions are searched:
+
+1. start positions (and ring settings whose position is known) by batch
+   decryption, with the known cables in the plugboard;
+2. for rotors whose position and ring are both hidden only their difference
+   matters for the wiring, so the first stage searches the difference and this
+   stage recovers the turnover point by moving both together;
+3. further plugboard cables by hill climbing, keeping the known ones fixed.
+
+The result records how many keys each stage tried and how long it took.
+"""
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from itertools import product
+from typing import Any, Dict, List, Optional, Sequence
+import time
+
+import numpy as np
+
+from app.enigma.batch import REFLECTOR_NAMES
+from app.enigma.machine import EnigmaMachine
+from .plugboard_solver import MAX_PAIRS, solve_plugboard
+from .rotor_search import Candidate, decrypt, decrypt_letters, search_rotors
+from .scoring import NgramScorer, text_letters
+
+TOP_CANDIDATES = 20
+PLUGBOARD_CANDIDATES = 3
+PLUGBOARD_TIME_BUDGET = 2.0
+MIN_CABLE_GAIN = 2.0  # Log10 score a found cable must add to be kept
+
+
+@dataclass
+class Solution:
+    """Recovered key for a challenge and the work it took."""
+    challenge_id: int
+    settings: Dict[str, Any]
+    plaintext: str
+    score: float
+    keys_tested: Dict[str, int] = field(default_factory=dict)  # Per search stage
+    seconds: float = 0.0
+
+
+@lru_cache(maxsize=None)
+def default_scorer() -> NgramScorer:
+    """Bigram scorer trained on the challenges' background texts."""
+    from app.api.challenges import CHALLENGES
+    return NgramScorer.from_corpus(' '.join(c["info"] for c in CHALLENGES), 2)
+
+
+def get_challenge(challenge_id: int) -> Dict[str, Any]:
+    from app.api.challenges import CHALLENGES
+    for challenge in CHALLENGES:
+        if challenge["id"] == challenge_id:
+            return challenge
+    raise ValueError(f"Unknown challenge: {challenge_id}")
+
+
+def decrypt_text(settings: Dict[str, Any], ciphertext: str) -> str:
+    """Decrypt a full ciphertext (punctuation kept) under complete settings."""
+    machine = EnigmaMachine()
+    if not machine.apply_settings(settings):
+        raise ValueError("Invalid settings")
+    return machine.encrypt_message(ciphertext)
+
+
+def refine_turnovers(letters: np.ndarray, candidates: Sequence[Candidate], free: Sequence[int],
+                     scorer: NgramScorer) -> List[Candidate]:
+    """Move position and ring of the ``free`` rotors together to find the turnover points.
+
+    This keeps every wiring offset the same and only changes when the rotors
+    to the left step, so the best start found for the offsets stays valid.
+    """
+    if not free:
+        return list(candidates)
+    rows = []
+    for candidate in candidates:
+        for deltas in product(range(26), repeat=len(free)):
+            positions, rings = list(candidate.positions), list(candidate.ring_settings)
+            for i, delta in zip(free, deltas):
+                positions[i] = (positions[i] + delta) % 26
+                rings[i] = (rings[i] + delta) % 26
+            rows.append((candidate, tuple(positions), tuple(rings)))
+    # Rows sharing a rotor order, reflector and plugboard are decrypted together
+    groups: Dict[Any, List[int]] = {}
+    for i, (c, _, _) in enumerate(rows):
+        groups.setdefault((c.rotors, c.reflector, tuple(sorted(c.plugboard.items()))), []).append(i)
+    scores = np.empty(len(rows))
+    for (order, reflector, plugboard), members in groups.items():
+        decrypted = decrypt_letters(order, reflector, np.array([rows[i][2] for i in members]), dict(plugboard),
+                                    np.array([rows[i][1] for i in members]), letters)
+        scores[members] = scorer.score(decrypted)
+    refined = [replace(c, score=float(s), positions=p, ring_settings=r) for (c, p, r), s in zip(rows, scores)]
+    return sorted(refined, reverse=True)[:len(candidates)]
+
+
+def prune_cables(candidate: Candidate, ciphertext: str, known_pairs: Dict[str, str],
+                 scorer: NgramScorer, min_gain: float = MIN_CABLE_GAIN,
+                 stats: Optional[Dict[str, int]] = None) -> Candidate:
+    """Drop found cables that add less than ``min_gain`` to the score (short texts overfit).
+
+    If ``stats`` is given, the number of plugboards scored is added to ``stats["trials"]``.
+    """
+    known = {c.upper() for pair in known_pairs.items() for c in pair}
+    while True:
+        extra = [(a, b) for a, b in candidate.plugboard.items() if a not in known]
+        trials = []
+        for a, b in extra:
+            plugboard = {x: y for x, y in candidate.plugboard.items() if (x, y) != (a, b)}
+            trial = replace(candidate, plugboard=plugboard)
+            trials.append(replace(trial, score=scorer.score_text(decrypt(trial, ciphertext))))
+        if stats is not None:
+            stats["trials"] = stats.get("trials", 0) + len(trials)
+        if not trials:
+            return candidate
+        best = max(trials)
+        if candidate.score - best.score >= min_gain:
+            return candidate
+        candidate = best
+
+
+def solve_challenge(challenge_id: int, ciphertext: Optional[str] = None, scorer: Optional[NgramScorer] = None,
+                    top_k: int = TOP_CANDIDATES, plugboard_time_budget: float = PLUGBOARD_TIME_BUDGET,
+                    workers: int = 1) -> Solution:
+    """Recover the hidden parts of a challenge's key from its ciphertext.
+
+    ``ciphertext`` defaults to the challenge's own. Fields of
+    ``settings_public`` that are not None are used as given.
+    """
+    started = time.monotonic()
+    challenge = get_challenge(challenge_id)
+    public = challenge["settings_public"]
+    ciphertext = ciphertext if ciphertext is not None else challenge["ciphertext"]
+    scorer = scorer or default_scorer()
+    letters = text_letters(ciphertext)
+
+    rotors = public["rotors"]
+    names = tuple(r["name"] for r in rotors)
+    both_hidden = [i for i, r in enumerate(rotors) if r["position"] is None and r["ring_setting"] is None]
+    position_choices = [range(26) if r["position"] is None else [r["position"] % 26] for r in rotors]
+    # With both hidden the ring is folded into the position (see refine_turnovers)
+    ring_choices = [
+        [r["ring_setting"] % 26] if r["ring_setting"] is not None else [0] if i in both_hidden else range(26)
+        for i, r in enumerate(rotors)
+    ]
+    reflectors = [public["reflector"]] if public["reflector"] else list(REFLECTOR_NAMES)
+    known_pairs = dict(public.get("plugboard") or {})
+    positions = np.array(list(product(*position_choices)))
+    ring_settings = list(product(*ring_choices))
+
+    keys_tested = {"positions": len(positions) * len(ring_settings) * len(reflectors)}
+    candidates = search_rotors(ciphertext, scorer, orders=[names], reflectors=reflectors,
+                               ring_settings=ring_settings, plugboard=known_pairs, positions=positions,
+                               top_k=top_k, workers=workers)
+
+    # The left rotor's ring only shifts its wiring, which its position already covers
+    turnover_rotors = [i for i in both_hidden if i > 0]
+    candidates = refine_turnovers(letters, candidates, turnover_rotors, scorer)
+    keys_tested["turnovers"] = len(candidates) * 26 ** len(turnover_rotors) if turnover_rotors else 0
+
+    best = candidates[0]
+    keys_tested["plugboard"] = 0
+    if len(known_pairs) < MAX_PAIRS and plugboard_time_budget > 0:
+        stats = {"trials": 0}
+        solved = solve_plugboard(ciphertext, candidates[:PLUGBOARD_CANDIDATES], scorer=scorer,
+                                 known_pairs=known_pairs, time_budget=plugboard_time_budget, seed=0, stats=stats)
+        best = prune_cables(solved[0], ciphertext, known_pairs, scorer, stats=stats)
+        keys_tested["plugboard"] = stats["trials"]
+
+    settings = best.settings()
+    return Solution(
+        challenge_id=challenge_id,
+        settings=settings,
+        plaintext=decrypt_text(settings, ciphertext),
+        score=best.score,
+        keys_tested=keys_tested,
+        seconds=time.monotonic() - started,
+    )
@@ -0,0 +1,58 @@
+"""
+Crib dragging: where can a guessed plaintext sit in a ciphertext?
+
+The reflector guarantees that no letter ever encrypts to itself, so a crib
+cannot be placed at any offset where one of its letters matches the cipher
+letter below it. All offsets of many cribs against many ciphertexts are checked
+at once with array comparisons (one pass per crib letter position).
+"""
+from typing import List, Sequence
+
+import numpy as np
+
+from app.enigma.batch import PAD
+from .bombe import Menu, build_menu
+from .scoring import text_letters
+
+CRIB_PAD = PAD - 1  # Crib padding; never equal to a letter or to ciphertext padding
+
+
+def letter_rows(texts: Sequence[str], width: int, fill: int) -> np.ndarray:
+    """Letters of each text as a (len(texts), width) matrix padded with ``fill``."""
+    rows = np.full((len(texts), width), fill, dtype=np.uint8)
+    for i, text in enumerate(texts):
+        letters = text_letters(text)[:width]
+        rows[i, :len(letters)] = letters
+    return rows
+
+
+def valid_offsets(cribs: Sequence[str], ciphertexts: Sequence[str]) -> np.ndarray:
+    """Boolean matrix (ciphertexts, cribs, offsets) of crib placements that are possible.
+
+    Offsets count ciphertext letters (other characters are ignored, as in
+    build_menu). An offset is valid if the crib fits and no crib letter equals
+    the cipher letter it would be aligned with.
+    """
+    crib_lengths = np.array([len(text_letters(c)) for c in cribs], dtype=np.intp)
+    cipher_lengths = np.array([len(text_letters(c)) for c in ciphertexts], dtype=np.intp)
+    crib_width = int(crib_lengths.max(initial=0))
+    offsets = int(cipher_lengths.max(initial=0))
+    crib_matrix = letter_rows(cribs, crib_width, CRIB_PAD)
+    cipher_matrix = letter_rows(ciphertexts, offsets + crib_width, PAD)
+
+    clash = np.zeros((len(ciphertexts), len(cribs), offsets), dtype=bool)
+    for j in range(crib_width):
+        clash |= cipher_matrix[:, None, j:j + offsets] == crib_matrix[None, :, j, None]
+    fits = np.arange(offsets)[None, None, :] + crib_lengths[None, :, None] <= cipher_lengths[:, None, None]
+    return fits & ~clash & (crib_lengths > 0)[None, :, None]
+
+
+def crib_positions(cribs: Sequence[str], ciphertexts: Sequence[str]) -> List[List[List[int]]]:
+    """Valid offsets as lists, indexed [ciphertext][crib]."""
+    valid = valid_offsets(cribs, ciphertexts)
+    return [[np.flatnonzero(row).tolist() for row in per_cipher] for per_cipher in valid]
+
+
+def candidate_menus(crib: str, ciphertext: str) -> List[Menu]:
+    """Bombe menus for every offset where the crib can sit in the ciphertext."""
+    return [build_menu(crib, ciphertext, offset) for offset in crib_positions([crib], [ciphertext])[0][0]]
@@ -0,0 +1,111 @@
+"""
+Equivalent ring/position settings for a given message length.
+
+Rotor wiring offsets only depend on position - ring setting (the shift), while
+stepping only depends on positions: the middle and fast rotors' notches decide
+on which key presses the left and middle rotors move. Two settings of one
+rotor order therefore encrypt every message of L letters identically when
+their start shifts agree and their middle/fast start positions give the same
+stepping sequence over L key presses. The left rotor has nothing to its left
+to step, so only its shift matters at all.
+
+For short messages most of the 676 middle/fast start positions step the same
+way (for L = 20 and single notches there are 60 distinct sequences), so a
+search that takes one representative per stepping sequence and all 17,576
+shifts covers 60 * 17,576 settings per rotor order and reflector instead of
+26**6. Representatives use the smallest middle/fast positions of their class,
+left ring setting 0 and the ring settings that give the required shifts.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.enigma.batch import ALL_POSITIONS, NOTCH, REFLECTOR_NAMES, ROTOR_NAMES, encrypt_shifts, plugboard_array
+from app.enigma.tables import shared_table
+from .rotor_search import Candidate, RotorOrder, push_top_k, rotor_orders
+from .scoring import IndexOfCoincidence, text_letters
+
+_MIDDLE, _FAST = np.divmod(np.arange(26 * 26), 26)  # Index = middle position * 26 + fast position
+
+
+@dataclass
+class SteppingClass:
+    """Middle/fast start positions that step identically, and the steps they make."""
+    middle: int  # Representative (smallest) positions
+    fast: int
+    size: int  # Number of middle/fast start positions in the class
+    offsets: np.ndarray  # (L, 3) steps each rotor has made when letter j is encrypted
+
+
+@lru_cache(maxsize=256)
+def _stepping(middle_rotor: int, fast_rotor: int, length: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cumulative steps (676, L, 3) for every middle/fast start position, plus unique() grouping."""
+    p1, p2 = _MIDDLE.copy(), _FAST.copy()
+    steps = np.zeros((26 * 26, length, 3), dtype=np.intp)
+    for k in range(length):
+        # Same rules as EnigmaMachine._rotate_rotors
+        middle = NOTCH[middle_rotor, p1]
+        fast = NOTCH[fast_rotor, p2]
+        steps[:, k] = np.stack([middle, middle | fast, np.ones_like(middle)], axis=1)
+        p1 = (p1 + (middle | fast)) % 26
+        p2 = (p2 + 1) % 26
+    offsets = np.cumsum(steps, axis=1)
+    _, first, inverse = np.unique(steps.reshape(26 * 26, -1), axis=0, return_index=True, return_inverse=True)
+    return offsets, first, inverse.ravel()
+
+
+def stepping_classes(order: RotorOrder, length: int) -> List[SteppingClass]:
+    """The distinct stepping sequences of a rotor order over ``length`` key presses."""
+    offsets, first, inverse = _stepping(ROTOR_NAMES.index(order[1]), ROTOR_NAMES.index(order[2]), length)
+    sizes = np.bincount(inverse, minlength=len(first))
+    classes = [SteppingClass(int(_MIDDLE[i]), int(_FAST[i]), int(n), offsets[i]) for i, n in zip(first, sizes)]
+    return sorted(classes, key=lambda c: (c.middle, c.fast))
+
+
+def canonicalize(order: RotorOrder, positions: Sequence[int], ring_settings: Sequence[int],
+                 length: int) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """Representative (positions, ring_settings) of a setting for messages of ``length`` letters."""
+    _, first, inverse = _stepping(ROTOR_NAMES.index(order[1]), ROTOR_NAMES.index(order[2]), length)
+    shifts = [(p - r) % 26 for p, r in zip(positions, ring_settings)]
+    representative = first[inverse[positions[1] % 26 * 26 + positions[2] % 26]]
+    middle, fast = int(_MIDDLE[representative]), int(_FAST[representative])
+    return (shifts[0], middle, fast), (0, (middle - shifts[1]) % 26, (fast - shifts[2]) % 26)
+
+
+def class_count(order: RotorOrder, length: int) -> int:
+    """Settings of one rotor order and reflector a canonical search tests (vs 26**6)."""
+    return len(stepping_classes(order, length)) * len(ALL_POSITIONS)
+
+
+def search_classes(ciphertext: str, scorer: Any = None,
+                   orders: Optional[Iterable[RotorOrder]] = None,
+                   reflectors: Optional[Iterable[str]] = None,
+                   plugboard: Optional[Dict[str, str]] = None,
+                   top_k: int = 10) -> List[Candidate]:
+    """Search every ring setting and start position, testing one setting per equivalence class.
+
+    Candidates carry representative settings (see canonicalize), best first.
+    """
+    scorer = scorer or IndexOfCoincidence()
+    letters = text_letters(ciphertext)
+    plug = plugboard_array(plugboard or {})
+    heap: List[Candidate] = []
+    for order in (orders or rotor_orders()):
+        indices = [ROTOR_NAMES.index(name) for name in order]
+        classes = stepping_classes(order, len(letters))
+        for reflector in (reflectors or REFLECTOR_NAMES):
+            table = shared_table(order, reflector)
+            for stepping in classes:
+                decrypted = encrypt_shifts(indices, REFLECTOR_NAMES.index(reflector), plug, ALL_POSITIONS,
+                                           stepping.offsets, letters, table)
+                scores = scorer.score(decrypted)
+                k = min(top_k, len(scores))
+                for i in np.argpartition(scores, -k)[-k:]:
+                    s0, s1, s2 = (int(s) for s in ALL_POSITIONS[i])
+                    push_top_k(heap, Candidate(
+                        float(scores[i]), tuple(order), (s0, stepping.middle, stepping.fast),
+                        (0, (stepping.middle - s1) % 26, (stepping.fast - s2) % 26), reflector,
+                        dict(plugboard or {})), top_k)
+    return sorted(heap, reverse=True)
@@ -0,0 +1,295 @@
+"""
+Sharded keyspace enumeration with checkpoint and resume.
+
+Every key of a search (rotor order, reflector, ring settings, start position)
+is a packed integer
+
+    ((order * reflectors + reflector) * ring_settings + ring) * 17576 + position
+
+so a shard is just a contiguous range of integers and shards with different
+indices never overlap. A worker searches its range in blocks of start
+positions (one batch decryption each) and writes its progress and best
+candidates to a small JSON checkpoint every few seconds; a restarted worker
+continues from the last checkpoint instead of starting over.
+
+Workers on one machine or on a shared filesystem coordinate through a work
+directory: a shard is claimed by creating its lock file exclusively, the lock
+is touched at every checkpoint, and a lock that has not been touched for
+LEASE_SECONDS belongs to a dead worker and may be taken over (together with
+its checkpoint).
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from app.enigma.batch import ALL_POSITIONS, REFLECTOR_NAMES
+from .rotor_search import Candidate, RotorOrder, push_top_k, rotor_orders, search_order
+from .scoring import text_letters
+
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "10"))  # Seconds between checkpoint writes
+LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", "300"))  # Lock age after which a shard is up for grabs
+POSITIONS = len(ALL_POSITIONS)
+
+
+def default_ring_settings() -> List[Tuple[int, int, int]]:
+    """Middle and fast ring settings; the left ring only shifts its wiring, which its position covers."""
+    return [(0, middle, fast) for middle in range(26) for fast in range(26)]
+
+
+@dataclass
+class Keyspace:
+    """The rotor orders, reflectors and ring settings of a search, with packed key indices."""
+    orders: List[RotorOrder] = field(default_factory=rotor_orders)
+    reflectors: List[str] = field(default_factory=lambda: list(REFLECTOR_NAMES))
+    ring_settings: List[Tuple[int, int, int]] = field(default_factory=default_ring_settings)
+
+    def __post_init__(self):
+        self.orders = [tuple(order) for order in self.orders]
+        self.reflectors = list(self.reflectors)
+        self.ring_settings = [tuple(int(r) % 26 for r in rings) for rings in self.ring_settings]
+
+    @property
+    def combinations(self) -> int:
+        return len(self.orders) * len(self.reflectors) * len(self.ring_settings)
+
+    @property
+    def size(self) -> int:
+        return self.combinations * POSITIONS
+
+    def encode(self, order: int, reflector: int, ring: int, position: int) -> int:
+        """Packed key for indices into orders, reflectors, ring_settings and ALL_POSITIONS."""
+        return ((order * len(self.reflectors) + reflector) * len(self.ring_settings) + ring) * POSITIONS + position
+
+    def decode(self, key: int) -> Tuple[int, int, int, int]:
+        """Inverse of encode()."""
+        if not 0 <= key < self.size:
+            raise ValueError(f"Key {key} is outside the keyspace of {self.size} keys")
+        combination, position = divmod(key, POSITIONS)
+        rest, ring = divmod(combination, len(self.ring_settings))
+        order, reflector = divmod(rest, len(self.reflectors))
+        return order, reflector, ring, position
+
+    def candidate(self, key: int, score: float = 0.0) -> Candidate:
+        order, reflector, ring, position = self.decode(key)
+        return Candidate(score, self.orders[order], tuple(int(p) for p in ALL_POSITIONS[position]),
+                         self.ring_settings[ring], self.reflectors[reflector])
+
+    def shard(self, index: int, count: int) -> Tuple[int, int]:
+        """Key range [start, end) of shard ``index`` out of ``count``; sizes differ by at most one key."""
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index} of {count}")
+        return self.size * index // count, self.size * (index + 1) // count
+
+    def blocks(self, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Split [start, end) into ranges that stay within one order, reflector and ring setting."""
+        while start < end:
+            stop = min(end, (start // POSITIONS + 1) * POSITIONS)
+            yield start, stop
+            start = stop
+
+    def fingerprint(self, ciphertext: str) -> str:
+        """Identifies a search, so a checkpoint is never resumed against a different one."""
+        description = json.dumps([self.orders, self.reflectors, self.ring_settings, ciphertext])
+        return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+@dataclass
+class Checkpoint:
+    """Progress of one shard: the next key to test and the best candidates so far."""
+    fingerprint: str
+    start: int
+    end: int
+    next_key: int
+    keys_tested: int = 0
+    best: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return self.next_key >= self.end
+
+    def candidates(self) -> List[Candidate]:
+        return [Candidate(c["score"], tuple(c["rotors"]), tuple(c["positions"]), tuple(c["ring_settings"]),
+                          c["reflector"], c["plugboard"]) for c in self.best]
+
+    def save(self, path: str):
+        """Write atomically, so a crash mid-write leaves the previous checkpoint intact."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+
+def search_range(ciphertext: str, keyspace: Keyspace, start: int, end: int,
+                 checkpoint_path: Optional[str] = None, scorer: Any = None,
+                 plugboard: Optional[Dict[str, str]] = None, top_k: int = 10,
+                 checkpoint_interval: float = CHECKPOINT_INTERVAL,
+                 on_checkpoint=None) -> Checkpoint:
+    """Search keys [start, end), resuming from and periodically saving a checkpoint file.
+
+    ``on_checkpoint`` is called after each write (the coordinator renews its
+    lease there). Returns the final checkpoint.
+    """
+    fingerprint = keyspace.fingerprint(ciphertext)
+    checkpoint = Checkpoint.load(checkpoint_path) if checkpoint_path else None
+    if checkpoint is None or (checkpoint.fingerprint, checkpoint.start, checkpoint.end) != (fingerprint, start, end):
+        checkpoint = Checkpoint(fingerprint, start, end, start)
+    letters = text_letters(ciphertext)
+    heap = checkpoint.candidates()
+    heap.sort()
+    last_write = time.monotonic()
+
+    for block_start, block_end in keyspace.blocks(checkpoint.next_key, end):
+        order, reflector, ring, position = keyspace.decode(block_start)
+        positions = ALL_POSITIONS[position:position + block_end - block_start]
+        for candidate in search_order(letters, keyspace.orders[order], keyspace.reflectors[reflector],
+                                      keyspace.ring_settings[ring], scorer, plugboard, positions, top_k):
+            push_top_k(heap, candidate, top_k)
+        checkpoint.next_key = block_end
+        checkpoint.keys_tested += block_end - block_start
+        if checkpoint_path and (checkpoint.done or time.monotonic() - last_write >= checkpoint_interval):
+            checkpoint.best = [asdict(c) for c in sorted(heap, reverse=True)]
+            checkpoint.save(checkpoint_path)
+            last_write = time.monotonic()
+            if on_checkpoint:
+                on_checkpoint(checkpoint)
+    checkpoint.best = [asdict(c) for c in sorted(heap, reverse=True)]
+    return checkpoint
+
+
+class FileCoordinator:
+    """Hands out the shards of one search to workers sharing a work directory."""
+
+    def __init__(self, directory: str, shard_count: int, lease_seconds: float = LEASE_SECONDS):
+        self.directory = directory
+        self.shard_count = shard_count
+        self.lease_seconds = lease_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, index: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"shard-{index:05d}.{suffix}")
+
+    def checkpoint_path(self, index: int) -> str:
+        return self._path(index, "json")
+
+    def is_done(self, index: int) -> bool:
+        return os.path.exists(self._path(index, "done"))
+
+    def claim(self, worker: str) -> Optional[int]:
+        """Claim a shard that is neither done nor held by a live worker; None when there is none."""
+        for index in range(self.shard_count):
+            if self.is_done(index):
+                continue
+            lock = self._path(index, "lock")
+            if os.path.exists(lock) and not self._break_stale_lock(index):
+                continue
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue  # Another worker got there first
+            with os.fdopen(fd, "w") as f:
+                f.write(worker)
+            return index
+        return None
+
+    def _stale(self, lock: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(lock) >= self.lease_seconds
+        except FileNotFoundError:
+            return True
+
+    def _break_stale_lock(self, index: int) -> bool:
+        """Remove a lock whose worker stopped renewing it; False if it is still live."""
+        lock = self._path(index, "lock")
+        if not self._stale(lock):
+            return False
+        # Only one worker at a time may break a lock, and it checks again
+        # under the guard so a lock just taken over by another worker survives
+        guard = self._path(index, "takeover")
+        try:
+            os.close(os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        try:
+            if not self._stale(lock):
+                return False
+            try:
+                os.remove(lock)
+            except FileNotFoundError:
+                pass
+            return True
+        finally:
+            os.remove(guard)
+
+    def renew(self, index: int):
+        os.utime(self._path(index, "lock"))
+
+    def finish(self, index: int, checkpoint: Checkpoint):
+        checkpoint.save(self.checkpoint_path(index))
+        with open(self._path(index, "done"), "w"):
+            pass
+        try:
+            os.remove(self._path(index, "lock"))
+        except FileNotFoundError:
+            pass
+
+    def results(self, top_k: int = 10) -> List[Candidate]:
+        """Best candidates over every shard checkpointed so far."""
+        heap: List[Candidate] = []
+        for index in range(self.shard_count):
+            checkpoint = Checkpoint.load(self.checkpoint_path(index))
+            for candidate in checkpoint.candidates() if checkpoint else []:
+                push_top_k(heap, candidate, top_k)
+        return sorted(heap, reverse=True)
+
+
+def run_worker(ciphertext: str, keyspace: Keyspace, coordinator: FileCoordinator, worker: Optional[str] = None,
+               scorer: Any = None, plugboard: Optional[Dict[str, str]] = None, top_k: int = 10,
+               checkpoint_interval: float = CHECKPOINT_INTERVAL) -> int:
+    """Claim and search shards until none are left; returns the number of shards finished."""
+    worker = worker or f"{os.uname().nodename}:{os.getpid()}"
+    finished = 0
+    while (index := coordinator.claim(worker)) is not None:
+        start, end = keyspace.shard(index, coordinator.shard_count)
+        checkpoint = search_range(ciphertext, keyspace, start, end, coordinator.checkpoint_path(index), scorer,
+                                  plugboard, top_k, checkpoint_interval,
+                                  on_checkpoint=lambda _, index=index: coordinator.renew(index))
+        coordinator.finish(index, checkpoint)
+        finished += 1
+    return finished
+
+
+def main():
+    """Search a ciphertext's keyspace as one worker of a sharded search.
+
+    Usage: python -m app.cryptanalysis.keyspace CIPHERTEXT work/ --shards 1000
+    Start as many workers as wanted on the same work directory; rerunning a
+    worker after a crash resumes its shard from the last checkpoint.
+    """
+    parser = argparse.ArgumentParser(description="Sharded Enigma keyspace search")
+    parser.add_argument("ciphertext")
+    parser.add_argument("directory", help="Work directory shared by the workers")
+    parser.add_argument("--shards", type=int, default=1000, help="Number of shards (same for every worker)")
+    parser.add_argument("--top", type=int, default=10, help="Candidates to keep")
+    args = parser.parse_args()
+    coordinator = FileCoordinator(args.directory, args.shards)
+    run_worker(args.ciphertext, Keyspace(), coordinator, top_k=args.top)
+    for candidate in coordinator.results(args.top):
+        print(f"{candidate.score:.5f} {json.dumps(candidate.settings())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Plugboard recovery by hill climbing / simulated annealing.
+
+With the rotor settings fixed, the scrambler (rotors + reflector, without the
+plugboard) at message position i is a fixed permutation S_i, and the plaintext
+is P(S_i(P(c_i))) for plugboard P. The S_i are computed once from the compiled
+integer engine; a trial plugboard change then only recomputes the positions
+whose cipher letter or scrambler output touches one of the changed letters,
+and only the n-grams overlapping those positions are re-scored.
+"""
+from dataclasses import replace
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import random
+import string
+import time
+
+import numpy as np
+
+from app.enigma.components import Plugboard, Reflector, Rotor, ROTOR_NOTCHES, ROTOR_WIRINGS, REFLECTOR_WIRINGS
+from app.enigma.engine import compile_machine, state_index, state_positions
+from .rotor_search import Candidate
+from .scoring import NgramScorer, language_model, text_letters
+
+MAX_PAIRS = 10
+ALL_SWAPS = [(a, b) for a in range(26) for b in range(a + 1, 26)]
+
+
+def default_plugboard_scorer() -> NgramScorer:
+    """English trigrams or bigrams when their table is built, else the challenge_solver bigrams.
+
+    Single-letter frequencies barely change when one cable is added, so the
+    climb needs an n-gram score to find its way.
+    """
+    for n in (3, 2):
+        try:
+            return language_model("english", n)
+        except OSError:
+            continue
+    from .challenge_solver import default_scorer
+    return default_scorer()
+
+
+def scrambler_tables(candidate: Candidate, length: int) -> np.ndarray:
+    """Scrambler permutation (no plugboard) for each of ``length`` key presses, shape (length, 26)."""
+    rotors = [
+        Rotor(name=name, wiring=ROTOR_WIRINGS[name], notch_positions=ROTOR_NOTCHES[name], ring_setting=ring)
+        for name, ring in zip(candidate.rotors, candidate.ring_settings)
+    ]
+    reflector = Reflector(name=candidate.reflector, wiring=REFLECTOR_WIRINGS[candidate.reflector])
+    engine = compile_machine(rotors, reflector, Plugboard())
+    tables = np.empty((length, 26), dtype=np.intp)
+    k = state_index(tuple(p % 26 for p in candidate.positions))
+    for i in range(length):
+        k = engine.next_state[k]
+        tables[i] = np.frombuffer(engine.substitution(state_positions(k)), dtype=np.uint8)
+    return tables
+
+
+class PlugboardClimber:
+    """Incrementally scored plugboard state for one rotor setting."""
+
+    def __init__(self, letters: np.ndarray, scrambler: np.ndarray, scorer: NgramScorer,
+                 plugboard: Optional[np.ndarray] = None, fixed: Sequence[int] = (), max_pairs: int = MAX_PAIRS):
+        self.cipher = np.asarray(letters, dtype=np.intp)
+        self.scrambler = scrambler
+        self.scorer = scorer
+        self.fixed = set(fixed)
+        self.max_pairs = max_pairs
+        self.rows = np.arange(len(self.cipher))
+        self.plug = np.arange(26) if plugboard is None else np.asarray(plugboard, dtype=np.intp).copy()
+        self.mid = self.scrambler[self.rows, self.plug[self.cipher]]  # Scrambler output before the exit plugboard
+        self.plain = self.plug[self.mid]
+        self.score = float(scorer.score(self.plain[None, :])[0])
+        self.trials = 1  # Plugboards scored so far
+
+    @property
+    def pairs(self) -> int:
+        return int((self.plug != np.arange(26)).sum()) // 2
+
+    def propose(self, a: int, b: int) -> Optional[np.ndarray]:
+        """Plugboard after toggling the a-b cable (None if the move is not allowed)."""
+        if a in self.fixed or b in self.fixed:
+            return None
+        plug = self.plug.copy()
+        if plug[a] == b:
+            plug[a], plug[b] = a, b  # Remove the cable
+            return plug
+        for letter in (a, b):
+            partner = plug[letter]
+            if partner in self.fixed:
+                return None
+            plug[letter], plug[partner] = letter, partner
+        if int((plug != np.arange(26)).sum()) // 2 >= self.max_pairs:
+            return None
+        plug[a], plug[b] = b, a
+        return plug
+
+    def delta(self, plug: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray, np.ndarray]:
+        """Score change for a proposed plugboard, with the positions and values that change."""
+        self.trials += 1
+        changed = plug != self.plug
+        affected = np.flatnonzero(changed[self.cipher] | changed[self.mid])
+        if not len(affected):
+            return 0.0, affected, affected, affected
+        mid = self.scrambler[affected, plug[self.cipher[affected]]]
+        plain = plug[mid]
+
+        # Re-score only the n-grams that overlap a changed position
+        n = self.scorer.n
+        starts = np.unique((affected[:, None] - np.arange(n)[None, :]).ravel())
+        starts = starts[(starts >= 0) & (starts <= len(self.cipher) - n)]
+        windows = starts[:, None] + np.arange(n)[None, :]
+        new_plain = self.plain.copy()
+        new_plain[affected] = plain
+        weights = 26 ** np.arange(n - 1, -1, -1)
+        table = self.scorer.log_probs
+        change = float(table[new_plain[windows] @ weights].sum() - table[self.plain[windows] @ weights].sum())
+        return change, affected, mid, plain
+
+    def apply(self, plug: np.ndarray, change: float, affected: np.ndarray, mid: np.ndarray, plain: np.ndarray):
+        self.plug = plug
+        self.mid[affected] = mid
+        self.plain[affected] = plain
+        self.score += change
+
+    def connections(self) -> Dict[str, str]:
+        """Current plugboard as a connections dict with one entry per cable."""
+        letters = string.ascii_uppercase
+        return {letters[a]: letters[b] for a, b in enumerate(self.plug) if a < b}
+
+
+def climb(climber: PlugboardClimber, rng: random.Random, deadline: float,
+          temperature: float = 0.0, max_rounds: int = 50) -> PlugboardClimber:
+    """Improve a climber's plugboard until no move helps, the deadline or max_rounds.
+
+    Each round tries every possible cable in random order. With a temperature
+    above zero worse moves are accepted with probability exp(delta / T), the
+    temperature falling linearly to zero over ``max_rounds`` (simulated annealing).
+    """
+    for round_number in range(max_rounds):
+        t = temperature * (1 - round_number / max_rounds)
+        improved = False
+        swaps = ALL_SWAPS[:]
+        rng.shuffle(swaps)
+        for a, b in swaps:
+            plug = climber.propose(a, b)
+            if plug is None:
+                continue
+            change, affected, mid, plain = climber.delta(plug)
+            if change > 1e-9 or (t > 0 and change < 0 and rng.random() < math.exp(change / t)):
+                climber.apply(plug, change, affected, mid, plain)
+                improved = improved or change > 1e-9
+            if time.monotonic() > deadline:
+                return climber
+        if not improved and t == 0:
+            break
+    return climber
+
+
+def solve_plugboard(ciphertext: str, candidates: Sequence[Candidate], scorer: Optional[NgramScorer] = None,
+                    known_pairs: Optional[Dict[str, str]] = None, time_budget: float = 10.0,
+                    seed: Optional[int] = None, temperature: float = 0.0, restarts: int = 1,
+                    max_pairs: int = MAX_PAIRS, stats: Optional[Dict[str, int]] = None) -> List[Candidate]:
+    """Recover the plugboard for the best rotor candidates.
+
+    ``known_pairs`` are kept fixed. Every candidate gets ``restarts`` climbs
+    (the first from the known pairs only, later ones from random extra cables)
+    within a share of ``time_budget`` seconds. With the same ``seed`` the same
+    moves are tried in the same order, so runs are reproducible as long as they
+    are not cut short by the time budget. Returns the candidates with their
+    plugboards filled in and re-scored, best first. If ``stats`` is given, the
+    number of plugboards scored is added to ``stats["trials"]``.
+    """
+    scorer = scorer or default_plugboard_scorer()
+    rng = random.Random(seed)
+    letters = text_letters(ciphertext)
+    known = Plugboard()
+    for a, b in (known_pairs or {}).items():
+        known.add_connection(a, b)
+    fixed = [ord(c) - ord('A') for c in known.connections]
+    start = np.arange(26)
+    for a, b in known.connections.items():
+        start[ord(a) - ord('A')] = ord(b) - ord('A')
+
+    results: List[Candidate] = []
+    began = time.monotonic()
+    for index, candidate in enumerate(candidates):
+        deadline = began + time_budget * (index + 1) / len(candidates)
+        scrambler = scrambler_tables(candidate, len(letters))
+        best: Optional[PlugboardClimber] = None
+        for restart in range(restarts):
+            climber = PlugboardClimber(letters, scrambler, scorer, start, fixed, max_pairs)
+            if restart:
+                for _ in range(rng.randrange(max_pairs - climber.pairs + 1)):
+                    a, b = rng.sample(range(26), 2)
+                    plug = climber.propose(a, b)
+                    if plug is not None:
+                        climber.apply(plug, *climber.delta(plug))
+            climb(climber, rng, deadline, temperature)
+            if stats is not None:
+                stats["trials"] = stats.get("trials", 0) + climber.trials
+            if best is None or climber.score > best.score:
+                best = climber
+            if time.monotonic() > deadline:
+                break
+        results.append(replace(candidate, score=best.score, plugboard=best.connections()))
+    return sorted(results, reverse=True)
@@ -0,0 +1,225 @@
+"""
+Rejewski's characteristic method for doubly enciphered message keys.
+
+Before 1938 every message key was typed twice at the daily ground setting, so
+the first six letters of each message are A1..A6 applied to k1 k2 k3 k1 k2 k3.
+With enough messages the products AD = A4*A1, BE = A5*A2 and CF = A6*A3 are
+known completely, and their cycle structure does not depend on the plugboard
+(which only conjugates them). The catalogue maps that structure to every
+rotor order, reflector and ground setting that produces it, so the attack is a
+lookup instead of a brute force.
+
+In this machine the fast rotor sits next to the reflector, so the other two
+rotors only conjugate AD, BE and CF as well: a characteristic pins down the
+fast rotor, its position and the reflector, and every middle and left rotor
+setting without a turnover in the six indicator letters shares it.
+
+The cycles of a product of two involutions come in pairs of equal length, so
+each product is characterised by a partition of 13 (101 possibilities) and a
+full characteristic fits in one 32-bit code.
+
+Catalogue file layout (little-endian): 12-byte header (magic, length of the
+JSON list of (rotor order, reflector) combinations, entry count), the JSON
+list padded to 4 bytes, then the uint32 codes in sorted order and the matching
+uint32 setting indices (combination * 17576 + position index).
+"""
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import struct
+
+import numpy as np
+
+from app.enigma.batch import ALL_POSITIONS, REFLECTOR_NAMES, ROTOR_NAMES, scrambler_permutations
+from app.enigma.tables import shared_table
+from .rotor_search import Candidate, RotorOrder, rotor_orders
+from .scoring import text_letters
+
+CATALOGUE_PATH = os.getenv("REJEWSKI_CATALOGUE", "data/rejewski_catalogue.bin")
+CATALOGUE_MAGIC = b"RJWK"
+CATALOGUE_HEADER = struct.Struct("<4sII")
+
+Characteristic = Tuple[Tuple[int, ...], Tuple[int, ...], Tuple[int, ...]]
+
+
+def _partitions(n: int, largest: int) -> List[Tuple[int, ...]]:
+    if n == 0:
+        return [()]
+    return [(part,) + rest for part in range(min(n, largest), 0, -1) for rest in _partitions(n - part, part)]
+
+
+PARTITIONS = _partitions(13, 13)  # Cycle-pair lengths of one product, 101 of them
+_WEIGHTS = 14 ** np.arange(13, dtype=np.int64)  # Packs "pairs of length L" counts into one integer
+_PARTITION_KEYS = np.array([sum(_WEIGHTS[part - 1] for part in p) for p in PARTITIONS], dtype=np.int64)
+_KEY_ORDER = np.argsort(_PARTITION_KEYS)
+
+
+def cycle_lengths(perms: np.ndarray) -> np.ndarray:
+    """Length of the cycle through each element for a (B, 26) batch of permutations."""
+    perms = np.asarray(perms, dtype=np.intp)
+    rows = np.arange(len(perms))[:, None]
+    start = np.arange(26)[None, :]
+    current = perms.copy()
+    lengths = np.zeros(perms.shape, dtype=np.intp)
+    for step in range(1, 27):
+        lengths[(current == start) & (lengths == 0)] = step
+        current = perms[rows, current]
+    return lengths
+
+
+def partition_index(perms: np.ndarray) -> np.ndarray:
+    """Index into PARTITIONS of the paired cycle structure of each permutation."""
+    lengths = cycle_lengths(perms)
+    counts = (lengths[:, :, None] == np.arange(1, 27)[None, None, :]).sum(axis=1)  # Elements per cycle length
+    pair_size = 2 * np.arange(1, 14)
+    # Each pair of L-cycles contributes 2L elements of length L
+    if counts[:, 13:].any() or (counts[:, :13] % pair_size).any():
+        raise ValueError("Permutation is not a product of two fixed-point-free involutions")
+    keys = (counts[:, :13] // pair_size) @ _WEIGHTS
+    found = np.searchsorted(_PARTITION_KEYS[_KEY_ORDER], keys)
+    return _KEY_ORDER[found]
+
+
+def characteristic_codes(perms: np.ndarray) -> np.ndarray:
+    """Pack the characteristics of (B, 3, 26) products AD, BE, CF into uint32 codes."""
+    index = [partition_index(perms[:, i]) for i in range(3)]
+    return ((index[0] * len(PARTITIONS) + index[1]) * len(PARTITIONS) + index[2]).astype(np.uint32)
+
+
+def decode_characteristic(code: int) -> Characteristic:
+    """Cycle lengths of AD, BE and CF (each cycle listed, longest first) for a code."""
+    count = len(PARTITIONS)
+    parts = (code // count // count, code // count % count, code % count)
+    return tuple(tuple(length for length in PARTITIONS[p] for _ in range(2)) for p in parts)
+
+
+def ground_setting_products(order: RotorOrder, reflector: str, turnover: bool = True) -> np.ndarray:
+    """AD, BE and CF (without plugboard, ring settings AAA) for every ground setting, shape (17576, 3, 26)."""
+    perms = scrambler_permutations([ROTOR_NAMES.index(name) for name in order], (0, 0, 0),
+                                   REFLECTOR_NAMES.index(reflector), ALL_POSITIONS, range(6),
+                                   turnover, shared_table(order, reflector)).astype(np.intp)
+    rows = np.arange(len(perms))[:, None]
+    return np.stack([perms[rows, i + 3, perms[:, i]] for i in range(3)], axis=1)
+
+
+def indicator_products(indicators: Iterable[str]) -> np.ndarray:
+    """Reconstruct AD, BE and CF from a day's doubly enciphered indicators, shape (3, 26).
+
+    Raises ValueError unless every letter occurs in each of the first three
+    positions (the products are then fully determined) and the indicators agree.
+    """
+    products = np.full((3, 26), -1, dtype=np.intp)
+    for indicator in indicators:
+        letters = text_letters(indicator)
+        if len(letters) != 6:
+            raise ValueError(f"Indicator must have 6 letters: {indicator}")
+        for i in range(3):
+            # A_i is an involution, so A_{i+3}(A_i(c_i)) = A_{i+3}(k_i) = c_{i+3}
+            first, second = int(letters[i]), int(letters[i + 3])
+            if products[i, first] not in (-1, second):
+                raise ValueError(f"Indicators are inconsistent at {indicator}")
+            products[i, first] = second
+    if (products < 0).any():
+        raise ValueError("Not enough indicators to determine AD, BE and CF completely")
+    return products
+
+
+def indicator_characteristic(indicators: Iterable[str]) -> int:
+    """Characteristic code of a day's indicators."""
+    return int(characteristic_codes(indicator_products(indicators)[None])[0])
+
+
+class Catalogue:
+    """Characteristic -> (rotor order, reflector, ground setting) index, memory-mapped from disk."""
+
+    def __init__(self, combinations: Sequence[Tuple[RotorOrder, str]], codes: np.ndarray, settings: np.ndarray):
+        self.combinations = [(tuple(order), reflector) for order, reflector in combinations]
+        self.codes = codes
+        self.settings = settings
+
+    @classmethod
+    def build(cls, orders: Optional[Iterable[RotorOrder]] = None,
+              reflectors: Optional[Iterable[str]] = None) -> "Catalogue":
+        """Compute the characteristic of every ground setting (all orders and reflectors by default)."""
+        combinations = [(tuple(order), reflector)
+                        for order in (orders or rotor_orders())
+                        for reflector in (reflectors or REFLECTOR_NAMES)]
+        codes = np.concatenate([
+            characteristic_codes(ground_setting_products(order, reflector)) for order, reflector in combinations
+        ]) if combinations else np.zeros(0, dtype=np.uint32)
+        order = np.argsort(codes, kind="stable")
+        return cls(combinations, codes[order], order.astype(np.uint32))
+
+    @classmethod
+    def open(cls, path: str = CATALOGUE_PATH) -> "Catalogue":
+        """Memory-map a catalogue written by save()."""
+        with open(path, "rb") as f:
+            magic, json_length, count = CATALOGUE_HEADER.unpack(f.read(CATALOGUE_HEADER.size))
+            if magic != CATALOGUE_MAGIC:
+                raise ValueError(f"{path} is not a Rejewski catalogue")
+            combinations = json.loads(f.read(json_length))
+        start = CATALOGUE_HEADER.size + json_length + (-json_length % 4)
+        codes = np.memmap(path, dtype="<u4", mode="r", offset=start, shape=(count,))
+        settings = np.memmap(path, dtype="<u4", mode="r", offset=start + 4 * count, shape=(count,))
+        return cls(combinations, codes, settings)
+
+    def save(self, path: str = CATALOGUE_PATH):
+        """Write the catalogue in the layout read by open().
+
+        The file is written under a temporary name and renamed into place, so
+        processes opening it concurrently never see a partial catalogue.
+        """
+        names = json.dumps(self.combinations).encode()
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(CATALOGUE_HEADER.pack(CATALOGUE_MAGIC, len(names), len(self.codes)))
+            f.write(names + b"\0" * (-len(names) % 4))
+            f.write(np.ascontiguousarray(self.codes, dtype="<u4").tobytes())
+            f.write(np.ascontiguousarray(self.settings, dtype="<u4").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def lookup(self, code: int) -> List[Candidate]:
+        """All settings with a characteristic, as candidates with an empty plugboard.
+
+        Positions are ground settings for ring settings AAA; with other rings
+        the same scrambler appears at position - ring (as long as the middle
+        rotor does not turn over within the six indicator letters).
+        """
+        low, high = np.searchsorted(self.codes, [code, code + 1])
+        found = []
+        for index in np.sort(self.settings[low:high]):
+            order, reflector = self.combinations[int(index) // len(ALL_POSITIONS)]
+            position = tuple(int(p) for p in ALL_POSITIONS[int(index) % len(ALL_POSITIONS)])
+            found.append(Candidate(0.0, tuple(order), position, (0, 0, 0), reflector))
+        return found
+
+    def find(self, indicators: Iterable[str]) -> List[Candidate]:
+        """Settings matching a day's doubly enciphered indicators."""
+        return self.lookup(indicator_characteristic(indicators))
+
+
+@lru_cache(maxsize=None)
+def load_catalogue(path: str = CATALOGUE_PATH) -> Catalogue:
+    """Open the catalogue file once per process, building and saving it first if it is missing."""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        Catalogue.build().save(path)
+    return Catalogue.open(path)
+
+
+def main():
+    """Build the catalogue file: python -m app.cryptanalysis.rejewski [path]"""
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else CATALOGUE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    Catalogue.build().save(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Ciphertext-only search for rotor order, reflector and start positions.
+
+For each (rotor order, reflector, ring settings) combination the ciphertext is
+decrypted under the 17,576 start positions with the NumPy batch engine, in
+blocks of SEARCH_BLOCK positions so memory stays bounded for long texts, and
+each block is scored in one call. Combinations are spread over a process pool
+and the best candidates are kept in a bounded top-k heap.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import permutations
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import heapq
+import os
+
+import numpy as np
+
+from app.enigma.batch import (ALL_POSITIONS, REFLECTOR_NAMES, ROTOR_NAMES, encrypt_batch, encrypt_positions,
+                              plugboard_array)
+from app.enigma.tables import encrypt_table, shared_table
+from .scoring import IndexOfCoincidence, letters_text, text_letters
+
+RotorOrder = Tuple[str, str, str]
+
+SEARCH_BLOCK = int(os.getenv("SEARCH_BLOCK", "2048"))  # Start positions decrypted and scored at once
+
+
+@dataclass(order=True)
+class Candidate:
+    """One scored key candidate (higher score is better)."""
+    score: float
+    rotors: RotorOrder = field(compare=False)
+    positions: Tuple[int, int, int] = field(compare=False)
+    ring_settings: Tuple[int, int, int] = field(compare=False)
+    reflector: str = field(compare=False)
+    plugboard: Dict[str, str] = field(default_factory=dict, compare=False)
+
+    def settings(self) -> Dict[str, Any]:
+        """Settings in the format used by the API and CHALLENGES."""
+        return {
+            "rotors": [
+                {"name": name, "position": position, "ring_setting": ring}
+                for name, position, ring in zip(self.rotors, self.positions, self.ring_settings)
+            ],
+            "reflector": self.reflector,
+            "plugboard": dict(self.plugboard),
+        }
+
+
+def rotor_orders(names: Sequence[str] = ROTOR_NAMES) -> List[RotorOrder]:
+    """All ordered choices of 3 different rotors (60 for the 5 standard rotors)."""
+    return [(a, b, c) for a, b, c in permutations(names, 3)]
+
+
+def push_top_k(heap: List[Candidate], candidate: Candidate, k: int):
+    """Add a candidate to a min-heap holding the k best candidates."""
+    if len(heap) < k:
+        heapq.heappush(heap, candidate)
+    elif candidate.score > heap[0].score:
+        heapq.heapreplace(heap, candidate)
+
+
+def decrypt_letters(order: RotorOrder, reflector: str, ring_settings: Any, plugboard: Optional[Dict[str, str]],
+                    positions: np.ndarray, letters: np.ndarray) -> np.ndarray:
+    """Decrypt one letter sequence under many start positions of one rotor order and reflector.
+
+    ``ring_settings`` is shared (3,) or one row per position (B, 3). Uses the
+    precomputed scrambler table when it has been built
+    (python -m app.enigma.tables) and the batch engine otherwise.
+    """
+    indices = [ROTOR_NAMES.index(name) for name in order]
+    plug = plugboard_array(plugboard or {})
+    positions = np.asarray(positions)
+    table = shared_table(order, reflector)
+    if table is not None:
+        return encrypt_table(table, indices, ring_settings, plug, positions, letters)
+    rings = np.asarray(ring_settings)
+    if rings.ndim == 1:
+        return encrypt_positions(indices, rings, REFLECTOR_NAMES.index(reflector), plug, positions, letters)
+    count = len(positions)
+    return encrypt_batch(np.tile(indices, (count, 1)), positions, rings,
+                         np.full(count, REFLECTOR_NAMES.index(reflector)), np.tile(plug, (count, 1)),
+                         np.tile(np.asarray(letters, dtype=np.uint8), (count, 1)))
+
+
+def search_order(letters: np.ndarray, order: RotorOrder, reflector: str, ring_settings: Sequence[int],
+                 scorer: Any = None, plugboard: Optional[Dict[str, str]] = None,
+                 positions: Optional[np.ndarray] = None, top_k: int = 10) -> List[Candidate]:
+    """Score every start position for one rotor order, reflector and ring settings."""
+    scorer = scorer or IndexOfCoincidence()
+    positions = ALL_POSITIONS if positions is None else np.asarray(positions)
+    heap: List[Candidate] = []
+    for start in range(0, len(positions), SEARCH_BLOCK):
+        block = positions[start:start + SEARCH_BLOCK]
+        scores = scorer.score(decrypt_letters(order, reflector, ring_settings, plugboard, block, letters))
+        k = min(top_k, len(scores))
+        for i in np.argpartition(scores, -k)[-k:] if k else []:
+            push_top_k(heap, Candidate(float(scores[i]), tuple(order), tuple(int(p) for p in block[i]),
+                                       tuple(int(r) for r in ring_settings), reflector,
+                                       dict(plugboard or {})), top_k)
+    return heap
+
+
+def _search_task(args: Tuple) -> List[Candidate]:
+    """Process pool entry point for search_order."""
+    return search_order(*args)
+
+
+def search_rotors(ciphertext: str, scorer: Any = None,
+                  orders: Optional[Iterable[RotorOrder]] = None,
+                  reflectors: Optional[Iterable[str]] = None,
+                  ring_settings: Iterable[Sequence[int]] = ((0, 0, 0),),
+                  plugboard: Optional[Dict[str, str]] = None,
+                  positions: Optional[np.ndarray] = None,
+                  top_k: int = 10, workers: Optional[int] = None,
+                  executor: Optional[Executor] = None) -> List[Candidate]:
+    """Search rotor orders, reflectors and start positions for a ciphertext.
+
+    By default every order of the known rotors is tried with every reflector,
+    all start positions and ring settings AAA, scored by index of coincidence.
+    ``workers`` processes are used (CPU count by default, 1 runs inline), or an
+    existing ``executor``. Returns the ``top_k`` best candidates, best first.
+    """
+    letters = text_letters(ciphertext)
+    tasks = [
+        (letters, tuple(order), reflector, tuple(rings), scorer, plugboard, positions, top_k)
+        for order in (orders or rotor_orders())
+        for reflector in (reflectors or REFLECTOR_NAMES)
+        for rings in ring_settings
+    ]
+    heap: List[Candidate] = []
+    workers = workers or os.cpu_count() or 1
+    own_executor = executor is None and workers > 1 and len(tasks) > 1
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        if executor is None:
+            results: Iterable[List[Candidate]] = map(_search_task, tasks)
+        else:
+            results = executor.map(_search_task, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+        for result in results:
+            for candidate in result:
+                push_top_k(heap, candidate, top_k)
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return sorted(heap, reverse=True)
+
+
+def decrypt(candidate: Candidate, ciphertext: str) -> str:
+    """Decrypt the letters of a ciphertext under a candidate's settings."""
+    letters = text_letters(ciphertext)
+    decrypted = decrypt_letters(candidate.rotors, candidate.reflector, candidate.ring_settings,
+                                candidate.plugboard, np.array([candidate.positions]), letters)
+    return letters_text(decrypted[0])
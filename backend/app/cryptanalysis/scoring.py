@@ -0,0 +1,186 @@
+"""
+Fitness functions for candidate decryptions.
+
+Every scorer takes a (B, L) matrix of letter indices (one candidate decryption
+per row) and returns a (B,) array of scores where higher means more like
+natural language, so whole batches of candidates are scored in one call.
+
+Large n-gram tables (a 4-gram table is 26**4 float32 = 1.8 MB) are saved as
+flat files and memory-mapped, so every worker process shares one copy.
+"""
+from functools import lru_cache
+from typing import Mapping, Optional
+import argparse
+import os
+import string
+import struct
+
+import numpy as np
+
+# n-gram table files: 16-byte header (magic, n) followed by 26**n little-endian float32
+NGRAM_MAGIC = b"NGRM"
+NGRAM_HEADER = struct.Struct("<4sB11x")
+NGRAM_DIR = os.getenv("NGRAM_DIR", "data/ngrams")
+
+# Letter frequencies in percent (Wikipedia, "Letter frequency")
+ENGLISH_FREQUENCIES = {
+    "A": 8.167, "B": 1.492, "C": 2.782, "D": 4.253, "E": 12.702, "F": 2.228, "G": 2.015,
+    "H": 6.094, "I": 6.966, "J": 0.153, "K": 0.772, "L": 4.025, "M": 2.406, "N": 6.749,
+    "O": 7.507, "P": 1.929, "Q": 0.095, "R": 5.987, "S": 6.327, "T": 9.056, "U": 2.758,
+    "V": 0.978, "W": 2.360, "X": 0.150, "Y": 1.974, "Z": 0.074,
+}
+GERMAN_FREQUENCIES = {
+    "A": 6.516, "B": 1.886, "C": 2.732, "D": 5.076, "E": 16.396, "F": 1.656, "G": 3.009,
+    "H": 4.577, "I": 6.550, "J": 0.268, "K": 1.417, "L": 3.437, "M": 2.534, "N": 9.776,
+    "O": 2.594, "P": 0.670, "Q": 0.018, "R": 7.003, "S": 7.270, "T": 6.154, "U": 4.166,
+    "V": 0.846, "W": 1.921, "X": 0.034, "Y": 0.039, "Z": 1.134,
+}
+
+
+def text_letters(text: str) -> np.ndarray:
+    """Letter indices (0-25) of the ASCII letters in a text, other characters dropped."""
+    data = np.frombuffer(text.upper().encode("ascii", errors="ignore"), dtype=np.uint8)
+    data = data[(data >= ord('A')) & (data <= ord('Z'))]
+    return (data - ord('A')).astype(np.uint8)
+
+
+def letters_text(letters: np.ndarray) -> str:
+    """Turn a 1-D array of letter indices back into upper-case text."""
+    return (np.asarray(letters, dtype=np.uint8) + ord('A')).tobytes().decode("ascii")
+
+
+def letter_counts(letters: np.ndarray) -> np.ndarray:
+    """Per-row letter histograms of a (B, L) matrix, shape (B, 26)."""
+    letters = np.atleast_2d(letters)
+    rows = letters.shape[0]
+    dtype = np.int32 if rows * 26 < 2 ** 31 else np.int64  # Half the memory of the default index type
+    flat = (np.arange(rows, dtype=dtype)[:, None] * 26 + letters.astype(dtype)).ravel()
+    return np.bincount(flat, minlength=rows * 26).reshape(rows, 26)
+
+
+class IndexOfCoincidence:
+    """Index of coincidence: ~0.066 for English, ~0.076 for German, ~0.038 for random text.
+
+    Needs no language data and does not care which letter is which, so it still
+    rises for rotor settings that are right but decrypt through a wrong plugboard.
+    """
+
+    def score(self, letters: np.ndarray) -> np.ndarray:
+        counts = letter_counts(letters).astype(np.float64)
+        n = counts.sum(axis=1)
+        return (counts * (counts - 1)).sum(axis=1) / np.maximum(n * (n - 1), 1)
+
+
+class NgramScorer:
+    """Sum of n-gram log probabilities from a table indexed by packed letter codes.
+
+    The table has 26**n entries; the n-gram c1..cn lives at index
+    c1*26**(n-1) + ... + cn, so scoring a batch is one gather and one sum.
+    """
+
+    def __init__(self, log_probs: np.ndarray, n: int, path: Optional[str] = None):
+        if log_probs.shape != (26 ** n,):
+            raise ValueError(f"Expected a table of {26 ** n} entries for n={n}")
+        self.log_probs = log_probs
+        self.n = n
+        self.path = path  # Set when the table is memory-mapped from a file
+
+    def __getstate__(self):
+        # File-backed tables travel to worker processes as a path and are
+        # mapped again there, so every process shares the same page cache.
+        if self.path is not None:
+            return {"path": self.path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "log_probs" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(NgramScorer.open(state["path"]).__dict__)
+
+    @classmethod
+    def open(cls, path: str) -> "NgramScorer":
+        """Memory-map a table written by save(); nothing is read until it is used."""
+        with open(path, "rb") as f:
+            magic, n = NGRAM_HEADER.unpack(f.read(NGRAM_HEADER.size))
+        if magic != NGRAM_MAGIC:
+            raise ValueError(f"{path} is not an n-gram table")
+        table = np.memmap(path, dtype="<f4", mode="r", offset=NGRAM_HEADER.size, shape=(26 ** n,))
+        return cls(table, n, path=os.path.abspath(path))
+
+    def save(self, path: str):
+        """Write the table in the flat file format read by open()."""
+        with open(path, "wb") as f:
+            f.write(NGRAM_HEADER.pack(NGRAM_MAGIC, self.n))
+            f.write(np.ascontiguousarray(self.log_probs, dtype="<f4").tobytes())
+
+    @classmethod
+    def from_counts(cls, counts: np.ndarray, n: int, floor: float = 0.01) -> "NgramScorer":
+        """Build a scorer from raw n-gram counts; unseen n-grams get ``floor`` counts."""
+        counts = np.asarray(counts, dtype=np.float64)
+        counts = np.where(counts > 0, counts, floor)
+        return cls(np.log10(counts / counts.sum()).astype(np.float32), n)
+
+    @classmethod
+    def from_frequencies(cls, frequencies: Mapping[str, float]) -> "NgramScorer":
+        """Build a single-letter scorer from a letter frequency table."""
+        counts = np.array([frequencies.get(c, 0.0) for c in string.ascii_uppercase])
+        return cls.from_counts(counts, 1)
+
+    @classmethod
+    def from_corpus(cls, text: str, n: int, floor: float = 0.01) -> "NgramScorer":
+        """Count the n-grams of a training text (letters only)."""
+        return cls.from_counts(np.bincount(ngram_codes(text_letters(text)[None, :], n).ravel(),
+                                           minlength=26 ** n), n, floor)
+
+    def score(self, letters: np.ndarray) -> np.ndarray:
+        return self.log_probs[ngram_codes(np.atleast_2d(letters), self.n)].sum(axis=1)
+
+    def score_text(self, text: str) -> float:
+        """Score the letters of a single text."""
+        return float(self.score(text_letters(text)[None, :])[0])
+
+
+def ngram_codes(letters: np.ndarray, n: int) -> np.ndarray:
+    """Packed codes of all n-grams in each row of a (B, L) matrix, shape (B, L-n+1)."""
+    dtype = np.int32 if 26 ** n < 2 ** 31 else np.int64
+    letters = np.asarray(letters, dtype=dtype)
+    width = letters.shape[1] - n + 1
+    codes = np.zeros((letters.shape[0], max(width, 0)), dtype=dtype)
+    for i in range(n):
+        codes = codes * 26 + letters[:, i:i + width]
+    return codes
+
+
+ENGLISH_MONOGRAMS = NgramScorer.from_frequencies(ENGLISH_FREQUENCIES)
+GERMAN_MONOGRAMS = NgramScorer.from_frequencies(GERMAN_FREQUENCIES)
+
+
+@lru_cache(maxsize=None)
+def language_model(language: str, n: int) -> NgramScorer:
+    """Open ``{NGRAM_DIR}/{language}_{n}.ngm`` (e.g. english_4.ngm), mapping it once per process.
+
+    Falls back to the built-in letter frequencies for n=1 when no file exists.
+    """
+    path = os.path.join(NGRAM_DIR, f"{language}_{n}.ngm")
+    if n == 1 and not os.path.exists(path):
+        return {"english": ENGLISH_MONOGRAMS, "german": GERMAN_MONOGRAMS}[language]
+    return NgramScorer.open(path)
+
+
+def main():
+    """Build an n-gram table file from a text corpus.
+
+    Usage: python -m app.cryptanalysis.scoring corpus.txt data/ngrams/english_4.ngm --n 4
+    """
+    parser = argparse.ArgumentParser(description="Build an n-gram table file from a text corpus")
+    parser.add_argument("corpus", help="Plain-text training corpus")
+    parser.add_argument("output", help="Table file to write")
+    parser.add_argument("--n", type=int, default=4, help="n-gram length (default 4)")
+    args = parser.parse_args()
+    with open(args.corpus, encoding="utf-8", errors="ignore") as f:
+        NgramScorer.from_corpus(f.read(), args.n).save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Zygalski sheets: perforated-sheet attack on doubly enciphered indicators.
+
+A "female" is an indicator whose letters i and i+3 are equal, which happens
+only where the product A_{i+3}*A_i has a fixed point. For every rotor order,
+reflector and female position the sheets mark (with a hole) the positions
+whose product has a fixed point. Each message's ground setting is sent in the
+clear, so a female sent at ground setting g under ring settings r needs a hole
+at g - r; stacking the shifted sheets of all females leaves only the ring
+settings where every hole lines up.
+
+A sheet is stored as 26x26 uint32 rows (left, middle rotor shift) whose low 26
+bits are the fast rotor shifts, so stacking is bitwise AND over whole arrays.
+Like the historical sheets they assume that only the fast rotor moves during
+the six indicator letters. Turnovers depend on the ground setting, which is
+known, so females whose indicator crosses one are left out of the stack for
+that rotor order.
+"""
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.enigma.batch import NOTCH, REFLECTOR_NAMES, ROTOR_NAMES
+from .rejewski import ground_setting_products
+from .rotor_search import RotorOrder, rotor_orders
+from .scoring import text_letters
+
+FULL_ROW = (1 << 26) - 1
+_BITS = np.uint32(1) << np.arange(26, dtype=np.uint32)
+
+Message = Tuple[str, str]  # (ground setting sent in the clear, 6-letter indicator)
+
+
+@dataclass
+class SheetMatch:
+    """Rotor order, reflector and ring settings left open by the stacked sheets."""
+    rotors: RotorOrder
+    reflector: str
+    ring_settings: Tuple[int, int, int]
+
+
+def pack_rows(holes: np.ndarray) -> np.ndarray:
+    """Pack the last axis (26 booleans) of an array into uint32 bitsets."""
+    return (holes.astype(np.uint32) * _BITS).sum(axis=-1, dtype=np.uint32)
+
+
+def rotate_bits(rows: np.ndarray, shifts: np.ndarray) -> np.ndarray:
+    """Rotate 26-bit rows left by per-row shifts (bit k moves to k + shift)."""
+    rows = rows.astype(np.uint64)
+    shifts = np.asarray(shifts, dtype=np.uint64) % 26
+    return (((rows << shifts) | (rows >> ((26 - shifts) % 26))) & FULL_ROW).astype(np.uint32)
+
+
+def females(messages: Iterable[Message]) -> List[Tuple[Tuple[int, int, int], int]]:
+    """(ground setting, female position) for every letter repeat in the indicators."""
+    found = []
+    for ground, indicator in messages:
+        g = tuple(int(x) for x in text_letters(ground))
+        letters = text_letters(indicator)
+        if len(g) != 3 or len(letters) != 6:
+            raise ValueError(f"Expected a 3-letter ground setting and a 6-letter indicator: {ground} {indicator}")
+        found.extend((g, j) for j in range(3) if letters[j] == letters[j + 3])
+    return found
+
+
+class ZygalskiSheets:
+    """Packed sheets for a set of rotor orders and reflectors, shape (combinations, 3, 26, 26)."""
+
+    def __init__(self, combinations: Sequence[Tuple[RotorOrder, str]], sheets: np.ndarray):
+        self.combinations = [(tuple(order), reflector) for order, reflector in combinations]
+        self.sheets = sheets
+        # Bit k of a reversed row is bit -k of the sheet, so a row rotated by g
+        # has bit r set where the sheet has a hole at g - r
+        fast = (-np.arange(26)) % 26
+        self._reversed = pack_rows(((sheets[..., None] & _BITS) != 0)[..., fast])
+
+    @classmethod
+    def build(cls, orders: Optional[Iterable[RotorOrder]] = None,
+              reflectors: Optional[Iterable[str]] = None) -> "ZygalskiSheets":
+        """Punch the sheets from the rotor and reflector wirings (all of them by default)."""
+        combinations = [(tuple(order), reflector)
+                        for order in (orders or rotor_orders())
+                        for reflector in (reflectors or REFLECTOR_NAMES)]
+        sheets = np.zeros((len(combinations), 3, 26, 26), dtype=np.uint32)
+        for c, (order, reflector) in enumerate(combinations):
+            products = ground_setting_products(order, reflector, turnover=False)  # (17576, 3, 26)
+            holes = (products == np.arange(26)).any(axis=2).reshape(26, 26, 26, 3)
+            sheets[c] = pack_rows(holes.transpose(3, 0, 1, 2))
+        return cls(combinations, sheets)
+
+    def stack(self, messages: Iterable[Message]) -> List[SheetMatch]:
+        """Stack the sheets of every female and return the settings where all holes line up."""
+        found = females(messages)
+        if not found:
+            return []
+        grounds = np.array([g for g, _ in found], dtype=np.intp)  # (F, 3)
+        positions = np.array([j for _, j in found], dtype=np.intp)
+        shifts = np.arange(26)
+        rows = (grounds[:, 0, None] - shifts) % 26  # (F, 26) left shift for each left ring setting
+        cols = (grounds[:, 1, None] - shifts) % 26
+
+        # (combinations, F, 26, 26): each female's sheet, shifted by its ground setting
+        sheets = self._reversed[:, positions][:, np.arange(len(found))[:, None, None], rows[:, :, None], cols[:, None, :]]
+        aligned = rotate_bits(sheets, grounds[None, :, 2, None, None])
+        aligned[~self._without_turnover(grounds)] = FULL_ROW
+        stacked = np.bitwise_and.reduce(aligned, axis=1)  # (combinations, 26, 26)
+
+        matches = []
+        for c, r0, r1 in zip(*np.nonzero(stacked)):
+            order, reflector = self.combinations[c]
+            bits = int(stacked[c, r0, r1])
+            matches.extend(
+                SheetMatch(order, reflector, (int(r0), int(r1), r2)) for r2 in range(26) if bits >> r2 & 1
+            )
+        return matches
+
+    def _without_turnover(self, grounds: np.ndarray) -> np.ndarray:
+        """(combinations, F) mask of ground settings where only the fast rotor moves for six key presses."""
+        middle = np.array([ROTOR_NAMES.index(order[1]) for order, _ in self.combinations], dtype=np.intp)
+        fast = np.array([ROTOR_NAMES.index(order[2]) for order, _ in self.combinations], dtype=np.intp)
+        # The middle rotor moves if the fast rotor is at its notch before a key
+        # press, and double steps if it starts at its own notch
+        fast_positions = (grounds[:, 2, None] + np.arange(6)) % 26  # (F, 6)
+        turns = NOTCH[fast[:, None, None], fast_positions[None]].any(axis=2)
+        turns |= NOTCH[middle[:, None], grounds[None, :, 1]]
+        return ~turns
+
+    def save(self, path: str):
+        np.savez(path, sheets=self.sheets, combinations=np.array(
+            [list(order) + [reflector] for order, reflector in self.combinations]))
+
+    @classmethod
+    def open(cls, path: str) -> "ZygalskiSheets":
+        data = np.load(path)
+        return cls([(tuple(str(name) for name in row[:3]), str(row[3])) for row in data["combinations"]], data["sheets"])
@@ -0,0 +1,287 @@
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+import string
+
+import numpy as np
+
+from .components import ROTOR_WIRINGS, ROTOR_NOTCHES, REFLECTOR_WIRINGS
+
+# Index order used for rotor and reflector arrays
+ROTOR_NAMES: Tuple[str, ...] = tuple(ROTOR_WIRINGS)
+REFLECTOR_NAMES: Tuple[str, ...] = tuple(REFLECTOR_WIRINGS)
+
+# Marks message matrix cells that are not letters (padding, spaces, punctuation)
+PAD = 255
+
+
+def _wiring_array(wiring: str) -> np.ndarray:
+    return np.frombuffer(wiring.encode("ascii"), dtype=np.uint8).astype(np.int16) - ord('A')
+
+
+FORWARD = np.stack([_wiring_array(ROTOR_WIRINGS[name]) for name in ROTOR_NAMES])  # [rotor][letter]
+BACKWARD = np.argsort(FORWARD, axis=1).astype(np.int16)
+REFLECT = np.stack([_wiring_array(REFLECTOR_WIRINGS[name]) for name in REFLECTOR_NAMES])
+NOTCH = np.array([[p in ROTOR_NOTCHES[name] for p in range(26)] for name in ROTOR_NAMES])
+
+# [rotor][shift][letter] with shift = position - ring setting, i.e. the same
+# offsets Rotor.encrypt_forward/encrypt_backward apply, folded into one lookup
+_SHIFTS = np.arange(26)[:, None]
+_LETTERS = np.arange(26)[None, :]
+FORWARD_SHIFTED = ((FORWARD[:, (_LETTERS + _SHIFTS) % 26] - _SHIFTS) % 26).astype(np.intp)
+BACKWARD_SHIFTED = ((BACKWARD[:, (_LETTERS + _SHIFTS) % 26] - _SHIFTS) % 26).astype(np.intp)
+ALL_POSITIONS = np.stack(np.unravel_index(np.arange(26 ** 3), (26, 26, 26)), axis=1)  # (17576, 3)
+
+
+def plugboard_array(connections: Mapping[str, str]) -> np.ndarray:
+    """Convert plugboard connections into a 26-entry swap table.
+
+    Applies the same rules as Plugboard.add_connection and raises ValueError
+    for connections it would reject.
+    """
+    table = np.arange(26, dtype=np.int16)
+    if len(connections) > 10:
+        raise ValueError("At most 10 plugboard connections are allowed")
+    for a, b in connections.items():
+        a, b = a.upper(), b.upper()
+        if len(a) != 1 or len(b) != 1 or a == b or a not in string.ascii_uppercase or b not in string.ascii_uppercase:
+            raise ValueError(f"Invalid plugboard connection: {a}-{b}")
+        i, j = ord(a) - ord('A'), ord(b) - ord('A')
+        if table[i] != i or table[j] != j:
+            raise ValueError(f"Invalid plugboard connection: {a}-{b}")
+        table[i], table[j] = j, i
+    return table
+
+
+def settings_arrays(settings: Sequence[Mapping[str, Any]]) -> Tuple[np.ndarray, ...]:
+    """Convert settings dicts (as used by the API and CHALLENGES) into batch arrays.
+
+    Returns (rotor_orders, positions, ring_settings, reflectors, plugboards).
+    Raises ValueError for unknown rotors or reflectors.
+    """
+    count = len(settings)
+    orders = np.zeros((count, 3), dtype=np.int16)
+    positions = np.zeros((count, 3), dtype=np.int16)
+    rings = np.zeros((count, 3), dtype=np.int16)
+    reflectors = np.zeros(count, dtype=np.int16)
+    plugboards = np.tile(np.arange(26, dtype=np.int16), (count, 1))
+    for i, s in enumerate(settings):
+        rotors = s["rotors"]
+        if len(rotors) != 3:
+            raise ValueError("Exactly 3 rotors are required")
+        for j, rotor in enumerate(rotors):
+            if rotor["name"] not in ROTOR_WIRINGS:
+                raise ValueError(f"Invalid rotor: {rotor['name']}")
+            orders[i, j] = ROTOR_NAMES.index(rotor["name"])
+            positions[i, j] = (rotor.get("position") or 0) % 26
+            rings[i, j] = (rotor.get("ring_setting") or 0) % 26
+        if s["reflector"] not in REFLECTOR_WIRINGS:
+            raise ValueError(f"Invalid reflector: {s['reflector']}")
+        reflectors[i] = REFLECTOR_NAMES.index(s["reflector"])
+        plugboards[i] = plugboard_array(s.get("plugboard") or {})
+    return orders, positions, rings, reflectors, plugboards
+
+
+def encode_texts(texts: Sequence[str]) -> np.ndarray:
+    """Encode ASCII texts into a padded matrix of ASCII codes (one row per text)."""
+    width = max((len(t) for t in texts), default=0)
+    codes = np.zeros((len(texts), width), dtype=np.uint8)
+    for i, text in enumerate(texts):
+        codes[i, :len(text)] = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    return codes
+
+
+def letter_matrix(codes: np.ndarray) -> np.ndarray:
+    """Map ASCII codes to letter indices 0-25, with PAD for everything else."""
+    folded = codes | 0x20  # lower case
+    is_letter = (folded >= ord('a')) & (folded <= ord('z'))
+    return np.where(is_letter, folded - ord('a'), PAD).astype(np.uint8)
+
+
+def decode_texts(codes: np.ndarray, letters: np.ndarray, lengths: Sequence[int]) -> List[str]:
+    """Rebuild texts from the original codes with encrypted letters substituted in."""
+    out = np.where(letters == PAD, codes, letters + ord('A')).astype(np.uint8)
+    return [out[i, :n].tobytes().decode("ascii") for i, n in enumerate(lengths)]
+
+
+def encrypt_batch(rotor_orders: np.ndarray, positions: np.ndarray, ring_settings: np.ndarray,
+                  reflectors: np.ndarray, plugboards: np.ndarray, messages: np.ndarray) -> np.ndarray:
+    """Encrypt many messages, each under its own settings, with array operations.
+
+    ``rotor_orders`` (B, 3) index ROTOR_NAMES, ``reflectors`` (B,) index
+    REFLECTOR_NAMES, ``positions`` and ``ring_settings`` are (B, 3), ``plugboards``
+    is (B, 26) and ``messages`` is a (B, L) matrix of letter indices with PAD
+    for cells that are not letters; PAD cells do not step the rotors and are
+    returned unchanged. The loop runs over message columns only, so the cost per
+    column is a handful of array operations regardless of the batch size.
+    Stepping and the signal path match EnigmaMachine exactly.
+    """
+    orders = np.asarray(rotor_orders, dtype=np.intp)
+    p = np.asarray(positions, dtype=np.int16) % 26
+    rings = np.asarray(ring_settings, dtype=np.int16) % 26
+    reflect = REFLECT[np.asarray(reflectors, dtype=np.intp)]  # (B, 26)
+    plugs = np.asarray(plugboards, dtype=np.int16)
+    messages = np.asarray(messages, dtype=np.uint8)
+    batch, width = messages.shape
+
+    rows = np.arange(batch)
+    forward = FORWARD[orders]  # (B, 3, 26)
+    backward = BACKWARD[orders]
+    notch_middle = NOTCH[orders[:, 1]]  # (B, 26)
+    notch_right = NOTCH[orders[:, 2]]
+    p0, p1, p2 = p[:, 0].copy(), p[:, 1].copy(), p[:, 2].copy()
+    out = messages.copy()
+
+    for j in range(width):
+        column = messages[:, j]
+        active = column != PAD
+        if not active.any():
+            continue
+        # Stepping (same rules as EnigmaMachine._rotate_rotors)
+        middle = notch_middle[rows, p1] & active
+        right = notch_right[rows, p2] & active
+        p0 = (p0 + middle) % 26
+        p1 = (p1 + (middle | right)) % 26
+        p2 = (p2 + active) % 26
+        shifts = (np.stack([p0, p1, p2], axis=1) - rings)  # (B, 3)
+
+        c = plugs[rows, np.where(active, column, 0)]
+        for i in range(3):
+            c = (forward[rows, i, (c + shifts[:, i]) % 26] - shifts[:, i]) % 26
+        c = reflect[rows, c]
+        for i in (2, 1, 0):
+            c = (backward[rows, i, (c + shifts[:, i]) % 26] - shifts[:, i]) % 26
+        c = plugs[rows, c]
+        out[:, j] = np.where(active, c, PAD)
+    return out
+
+
+def encrypt_texts(settings: Sequence[Mapping[str, Any]], texts: Sequence[str]) -> List[str]:
+    """Encrypt ASCII texts, each under its own settings dict, in one batch."""
+    return encrypt_arrays(settings_arrays(settings), texts)
+
+
+def stack_settings(rows: Sequence[Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, ...]:
+    """Join settings_arrays results (e.g. validated one item at a time) into one batch."""
+    return tuple(np.concatenate(parts) for parts in zip(*rows))
+
+
+def encrypt_arrays(arrays: Tuple[np.ndarray, ...], texts: Sequence[str]) -> List[str]:
+    """Encrypt ASCII texts under settings already converted by settings_arrays."""
+    codes = encode_texts(texts)
+    letters = encrypt_batch(*arrays, letter_matrix(codes))
+    return decode_texts(codes, letters, [len(t) for t in texts])
+
+
+def encrypt_positions(rotor_order: Sequence[int], ring_settings: Sequence[int], reflector: int,
+                      plugboard: np.ndarray, positions: np.ndarray, letters: np.ndarray) -> np.ndarray:
+    """Encrypt one letter sequence under many start positions of one rotor order.
+
+    This is the key-search variant of encrypt_batch: rotor order, rings,
+    reflector and plugboard are shared, so every rotor stage is a single gather
+    from a flat [shift, letter] table. ``positions`` is (B, 3), ``letters`` is a
+    1-D array of letter indices (no padding); returns a (B, L) letter matrix.
+    """
+    o0, o1, o2 = (int(o) for o in rotor_order)
+    f0, f1, f2 = (FORWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    b0, b1, b2 = (BACKWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    reflect = REFLECT[int(reflector)].astype(np.intp)
+    plug = np.asarray(plugboard, dtype=np.intp)
+    notch_middle, notch_right = NOTCH[o1], NOTCH[o2]
+    r0, r1, r2 = (int(r) % 26 for r in ring_settings)
+    p = np.asarray(positions, dtype=np.intp) % 26
+    p0, p1, p2 = p[:, 0].copy(), p[:, 1].copy(), p[:, 2].copy()
+
+    out = np.empty((len(p), len(letters)), dtype=np.uint8)
+    for j, letter in enumerate(np.asarray(letters, dtype=np.intp)):
+        middle = notch_middle[p1]
+        right = notch_right[p2]
+        p0 = (p0 + middle) % 26
+        p1 = (p1 + (middle | right)) % 26
+        p2 = (p2 + 1) % 26
+        s0 = (p0 - r0) % 26 * 26
+        s1 = (p1 - r1) % 26 * 26
+        s2 = (p2 - r2) % 26 * 26
+        c = f2[s2 + f1[s1 + f0[s0 + plug[letter]]]]
+        c = b0[s0 + b1[s1 + b2[s2 + reflect[c]]]]
+        out[:, j] = plug[c]
+    return out
+
+
+def encrypt_shifts(rotor_order: Sequence[int], reflector: int, plugboard: np.ndarray,
+                   shifts: np.ndarray, offsets: np.ndarray, letters: np.ndarray,
+                   table: Optional[np.ndarray] = None) -> np.ndarray:
+    """Encrypt one letter sequence under many rotor shifts that share one stepping sequence.
+
+    ``shifts`` is (B, 3) start position minus ring setting per rotor and
+    ``offsets`` is (L, 3): how far each rotor has stepped by the time letter j
+    is encrypted. Because every row steps the same way, the per-column work is
+    three scalar additions on top of the gathers of encrypt_positions. With
+    the rotor order's precomputed scrambler ``table`` (see app.enigma.tables)
+    each letter is a single gather.
+    """
+    o0, o1, o2 = (int(o) for o in rotor_order)
+    f0, f1, f2 = (FORWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    b0, b1, b2 = (BACKWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    reflect = REFLECT[int(reflector)].astype(np.intp)
+    plug = np.asarray(plugboard, dtype=np.intp)
+    s = np.asarray(shifts, dtype=np.intp) % 26
+    offsets = np.asarray(offsets, dtype=np.intp)
+
+    out = np.empty((len(s), len(letters)), dtype=np.uint8)
+    if table is not None:
+        flat = np.asarray(table).ravel()
+        for j, letter in enumerate(np.asarray(letters, dtype=np.intp)):
+            shift = (((s[:, 0] + offsets[j, 0]) % 26 * 26 + (s[:, 1] + offsets[j, 1]) % 26) * 26
+                     + (s[:, 2] + offsets[j, 2]) % 26)
+            out[:, j] = plug[flat[shift * 26 + plug[letter]]]
+        return out
+    for j, letter in enumerate(np.asarray(letters, dtype=np.intp)):
+        s0 = (s[:, 0] + offsets[j, 0]) % 26 * 26
+        s1 = (s[:, 1] + offsets[j, 1]) % 26 * 26
+        s2 = (s[:, 2] + offsets[j, 2]) % 26 * 26
+        c = f2[s2 + f1[s1 + f0[s0 + plug[letter]]]]
+        c = b0[s0 + b1[s1 + b2[s2 + reflect[c]]]]
+        out[:, j] = plug[c]
+    return out
+
+
+def scrambler_permutations(rotor_order: Sequence[int], ring_settings: Sequence[int], reflector: int,
+                           positions: np.ndarray, steps: Sequence[int], turnover: bool = True,
+                           table: Optional[np.ndarray] = None) -> np.ndarray:
+    """Full scrambler permutations (rotors and reflector, no plugboard) at selected key presses.
+
+    ``steps`` are 0-based key press indices counted from the start positions.
+    Returns a (B, len(steps), 26) matrix; entry [b, k, x] is what letter x
+    encrypts to at key press ``steps[k]`` from start position ``positions[b]``.
+    With ``turnover=False`` only the fast rotor steps, as historical sheets and
+    catalogues assumed. A precomputed scrambler ``table`` for the rotor order
+    and reflector replaces the composition with a lookup.
+    """
+    o0, o1, o2 = (int(o) for o in rotor_order)
+    f0, f1, f2 = (FORWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    b0, b1, b2 = (BACKWARD_SHIFTED[o].ravel() for o in (o0, o1, o2))
+    reflect = REFLECT[int(reflector)].astype(np.intp)
+    notch_middle, notch_right = NOTCH[o1], NOTCH[o2]
+    r0, r1, r2 = (int(r) % 26 for r in ring_settings)
+    p = np.asarray(positions, dtype=np.intp) % 26
+    p0, p1, p2 = p[:, 0].copy(), p[:, 1].copy(), p[:, 2].copy()
+
+    wanted = {step: k for k, step in enumerate(steps)}
+    out = np.empty((len(p), len(steps), 26), dtype=np.uint8)
+    for j in range(max(steps, default=-1) + 1):
+        if turnover:
+            middle = notch_middle[p1]
+            right = notch_right[p2]
+            p0 = (p0 + middle) % 26
+            p1 = (p1 + (middle | right)) % 26
+        p2 = (p2 + 1) % 26
+        if j not in wanted:
+            continue
+        if table is not None:
+            out[:, wanted[j]] = table[((p0 - r0) % 26 * 26 + (p1 - r1) % 26) * 26 + (p2 - r2) % 26]
+            continue
+        s0 = ((p0 - r0) % 26 * 26)[:, None]
+        s1 = ((p1 - r1) % 26 * 26)[:, None]
+        s2 = ((p2 - r2) % 26 * 26)[:, None]
+        c = f2[s2 + f1[s1 + f0[s0 + _LETTERS]]]
+        out[:, wanted[j]] = b0[s0 + b1[s1 + b2[s2 + reflect[c]]]]
+    return out
@@ -0,0 +1,380 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+import os
+import string
+
+import numpy as np
+
+from .components import Rotor, Reflector, Plugboard, ROTOR_WIRINGS, REFLECTOR_WIRINGS
+from .tables import shared_table
+
+Positions = Tuple[int, int, int]
+RotorSpec = Tuple[str, Tuple[int, ...], int]  # (wiring, notch positions, ring setting)
+EngineKey = Tuple[Tuple[RotorSpec, ...], Optional[str], Tuple[Tuple[str, str], ...]]
+
+# Letter <-> index lookups used at the edges of the signal path
+LETTERS = string.ascii_uppercase
+LETTER_INDEX: Dict[str, int] = {c: i for i, c in enumerate(LETTERS)}
+LETTER_INDEX.update({c.lower(): i for i, c in enumerate(LETTERS)})
+NEXT_POSITION = tuple((i + 1) % 26 for i in range(26))
+STATE_COUNT = 26 ** 3  # Number of rotor position triples
+
+# Number of compiled configurations kept in memory (least recently used are evicted)
+ENGINE_CACHE_SIZE = int(os.getenv("ENIGMA_ENGINE_CACHE_SIZE", "64"))
+
+# Translation tables are 256 bytes long so they can be chained with bytes.translate;
+# only the first 26 entries carry the wiring, the rest map to themselves.
+IDENTITY = bytes(range(26))
+_PASSTHROUGH = bytes(range(26, 256))
+UNBUILT = 0xff  # Marks substitution table slots that have not been composed yet
+
+_ROTOR_BY_WIRING = {wiring: name for name, wiring in ROTOR_WIRINGS.items()}
+_REFLECTOR_BY_WIRING = {wiring: name for name, wiring in REFLECTOR_WIRINGS.items()}
+
+# Bytes encrypted per vectorized pass by encrypt_buffer (bounds its temporary arrays)
+BUFFER_CHUNK = 1 << 20
+
+
+def wiring_table(wiring: str) -> Tuple[int, ...]:
+    """Convert a 26-letter wiring string into an integer table."""
+    return tuple(ord(c) - ord('A') for c in wiring.upper())
+
+
+def inverse_table(table: Sequence[int]) -> Tuple[int, ...]:
+    """Invert an integer permutation table."""
+    inverse = [0] * len(table)
+    for i, j in enumerate(table):
+        inverse[j] = i
+    return tuple(inverse)
+
+
+def translation(table: Sequence[int]) -> bytes:
+    """Turn a 26-entry integer table into a bytes.translate table."""
+    return bytes(table) + _PASSTHROUGH
+
+
+def rotor_tables(wiring: str, ring_setting: int) -> Tuple[Tuple[bytes, ...], Tuple[bytes, ...]]:
+    """Build forward and backward tables for every position of a rotor.
+
+    Entry [position][letter] already includes the ring setting and position
+    offsets, so one lookup replaces a full encrypt_forward/encrypt_backward call.
+    """
+    forward = wiring_table(wiring)
+    backward = inverse_table(forward)
+    fwd: List[bytes] = []
+    bwd: List[bytes] = []
+    for position in range(26):
+        shift = position - ring_setting
+        fwd.append(translation([(forward[(c + shift) % 26] - shift) % 26 for c in range(26)]))
+        bwd.append(translation([(backward[(c + shift) % 26] - shift) % 26 for c in range(26)]))
+    return tuple(fwd), tuple(bwd)
+
+
+def plugboard_table(pairs: Sequence[Tuple[str, str]]) -> Tuple[int, ...]:
+    """Convert plugboard connections into an integer swap table."""
+    table = list(range(26))
+    for a, b in pairs:
+        if a in LETTER_INDEX and b in LETTER_INDEX:
+            table[LETTER_INDEX[a]] = LETTER_INDEX[b]
+    return tuple(table)
+
+
+def config_key(rotors: Sequence[Rotor], reflector: Optional[Reflector], plugboard: Plugboard) -> EngineKey:
+    """Return a hashable key describing everything except rotor positions."""
+    return (
+        tuple((r.wiring, tuple(r.notch_positions), r.ring_setting) for r in rotors),
+        reflector.wiring if reflector else None,
+        tuple(sorted(plugboard.connections.items())),
+    )
+
+
+def state_index(positions: Positions) -> int:
+    """Pack a rotor position triple into a single index (0-17575)."""
+    p0, p1, p2 = positions
+    return (p0 * 26 + p1) * 26 + p2
+
+
+def state_positions(k: int) -> Positions:
+    """Unpack a state index into a rotor position triple."""
+    p01, p2 = divmod(k, 26)
+    p0, p1 = divmod(p01, 26)
+    return p0, p1, p2
+
+
+@lru_cache(maxsize=None)
+def stepping_table(middle_notches: Tuple[int, ...], right_notches: Tuple[int, ...]) -> Tuple[int, ...]:
+    """Map every state index to the state index after one key press.
+
+    Implements the same rules as EnigmaMachine._rotate_rotors: a middle rotor
+    at its notch steps all three rotors (double-step), otherwise a right rotor
+    at its notch steps the middle and right rotors, otherwise only the right
+    rotor steps. Only the notch positions matter, so tables are shared.
+    """
+    table = []
+    for k in range(STATE_COUNT):
+        p0, p1, p2 = state_positions(k)
+        if p1 in middle_notches:
+            p0, p1 = NEXT_POSITION[p0], NEXT_POSITION[p1]
+        elif p2 in right_notches:
+            p1 = NEXT_POSITION[p1]
+        table.append(state_index((p0, p1, NEXT_POSITION[p2])))
+    return tuple(table)
+
+
+@dataclass(frozen=True)
+class SteppingCycle:
+    """Every rotor state reachable from one start state, in key-press order.
+
+    The stepping motion is a deterministic function of a finite state, so the
+    sequence of states is a short tail (at most a few key presses while a
+    double-step settles) followed by a cycle that repeats forever. Storing one
+    pass through both turns "state after n key presses" into a single lookup.
+    """
+    states: Tuple[int, ...]  # states[i] = state index after i key presses
+    cycle_start: int  # First index of the repeating part of ``states``
+
+    @cached_property
+    def state_array(self) -> np.ndarray:
+        """``states`` as an index array, built once per (cached) cycle."""
+        return np.array(self.states, dtype=np.intp)
+
+    @property
+    def period(self) -> int:
+        """Number of key presses after which the rotor states repeat."""
+        return len(self.states) - self.cycle_start
+
+    def state_after(self, key_presses: int) -> int:
+        """State index after the given number of key presses."""
+        if key_presses < 0:
+            raise ValueError("key_presses must not be negative")
+        if key_presses >= len(self.states):
+            key_presses = self.cycle_start + (key_presses - self.cycle_start) % self.period
+        return self.states[key_presses]
+
+    def positions_after(self, key_presses: int) -> Positions:
+        """Rotor positions after the given number of key presses."""
+        return state_positions(self.state_after(key_presses))
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def stepping_cycle(middle_notches: Tuple[int, ...], right_notches: Tuple[int, ...], start: int) -> SteppingCycle:
+    """Walk the stepping table from a start state until a state repeats."""
+    next_state = stepping_table(middle_notches, right_notches)
+    seen: Dict[int, int] = {}
+    states: List[int] = []
+    k = start
+    while k not in seen:
+        seen[k] = len(states)
+        states.append(k)
+        k = next_state[k]
+    return SteppingCycle(states=tuple(states), cycle_start=seen[k])
+
+
+@dataclass(frozen=True)
+class CompiledEnigma:
+    """Integer-table form of a fixed rotor order, ring settings, reflector and plugboard.
+
+    Rotor positions are not part of the compiled state; they are passed in and
+    returned explicitly so one compiled engine can serve any start position.
+    The full plugboard->rotors->reflector->rotors->plugboard substitution for a
+    position triple is built on first use and kept in ``_substitutions``.
+    """
+    forward: Tuple[Tuple[bytes, ...], ...]  # [rotor][position] -> translation table
+    backward: Tuple[Tuple[bytes, ...], ...]
+    reflector: bytes
+    plugboard: bytes
+    next_state: Tuple[int, ...]  # [state index] -> state index after one key press
+    notches: Tuple[Tuple[int, ...], Tuple[int, ...]]  # Middle and right rotor notches
+    ring_settings: Positions = (0, 0, 0)
+    scrambler: Optional[np.ndarray] = field(default=None, repr=False, compare=False)  # Shared table, if built
+    _substitutions: bytearray = field(default_factory=lambda: bytearray(b'\xff') * (STATE_COUNT * 26), repr=False, compare=False)
+
+    def step(self, positions: Positions) -> Positions:
+        """Advance the rotor positions by one key press (with double-stepping)."""
+        return state_positions(self.next_state[state_index(positions)])
+
+    def positions_after(self, positions: Positions, key_presses: int) -> Positions:
+        """Jump ahead: rotor positions after a number of key presses from a start."""
+        cycle = stepping_cycle(self.notches[0], self.notches[1], state_index(positions))
+        return cycle.positions_after(key_presses)
+
+    def substitution(self, positions: Positions) -> bytes:
+        """Return the 26-letter substitution for one rotor position triple."""
+        k = state_index(positions)
+        if self._substitutions[k * 26] == UNBUILT:
+            self._build(k)
+        return bytes(self._substitutions[k * 26:k * 26 + 26])
+
+    def _build(self, k: int):
+        """Compose the component tables for one position triple into the cache.
+
+        With the precomputed scrambler table (app.enigma.tables) only the
+        plugboard is composed around one stored permutation.
+        """
+        p0, p1, p2 = state_positions(k)
+        if self.scrambler is not None:
+            r0, r1, r2 = self.ring_settings
+            shift = state_index(((p0 - r0) % 26, (p1 - r1) % 26, (p2 - r2) % 26))
+            scrambler = bytes(self.scrambler[shift]) + _PASSTHROUGH
+            table = IDENTITY.translate(self.plugboard).translate(scrambler).translate(self.plugboard)
+            self._substitutions[k * 26:k * 26 + 26] = table
+            return
+        f0, f1, f2 = self.forward
+        b0, b1, b2 = self.backward
+        table = (IDENTITY.translate(self.plugboard)
+                 .translate(f0[p0]).translate(f1[p1]).translate(f2[p2])
+                 .translate(self.reflector)
+                 .translate(b2[p2]).translate(b1[p1]).translate(b0[p0])
+                 .translate(self.plugboard))
+        self._substitutions[k * 26:k * 26 + 26] = table
+
+    def encrypt_index(self, c: int, positions: Positions, plugged: bool = True) -> int:
+        """Send a letter index through the signal path at the given positions."""
+        if not plugged:
+            c = self.plugboard[c]  # cancelled by the entry plugboard of the substitution
+        k = state_index(positions)
+        out_c = self._substitutions[k * 26 + c]
+        if out_c == UNBUILT:
+            self._build(k)
+            out_c = self._substitutions[k * 26 + c]
+        return out_c
+
+    def encrypt_char(self, char: str, positions: Positions) -> Tuple[str, Positions]:
+        """Step the rotors and encrypt one character."""
+        c = LETTER_INDEX.get(char)
+        plugged = True
+        if c is None:
+            if not char.isalpha():
+                return char, positions
+            c, plugged = fold_letter(char)
+        positions = self.step(positions)
+        return LETTERS[self.encrypt_index(c, positions, plugged)], positions
+
+    def encrypt_text(self, text: str, positions: Positions) -> Tuple[str, Positions]:
+        """Encrypt a whole text starting at the given positions.
+
+        Returns the ciphertext and the rotor positions after the last key press.
+        """
+        k = state_index(positions)
+        plug = self.plugboard
+        next_state = self.next_state
+        index = LETTER_INDEX
+        letters = LETTERS
+        substitutions = self._substitutions
+        build = self._build
+        out: List[str] = []
+        append = out.append
+        for char in text:
+            c = index.get(char)
+            if c is None:
+                if not char.isalpha():
+                    append(char)
+                    continue
+                c, plugged = fold_letter(char)
+                if not plugged:
+                    c = plug[c]
+            k = next_state[k]
+            out_c = substitutions[k * 26 + c]
+            if out_c == UNBUILT:
+                build(k)
+                out_c = substitutions[k * 26 + c]
+            append(letters[out_c])
+        return ''.join(out), state_positions(k)
+
+    def encrypt_buffer(self, data, positions: Positions, out=None) -> Tuple[int, Positions]:
+        """Encrypt ASCII bytes from any buffer into ``out`` (``data`` itself by default).
+
+        ``data`` may be bytes, bytearray, memoryview, mmap or a NumPy array;
+        ``out`` must be writable and at least as long. Letters are written as
+        upper case and every other byte passes through unchanged (including
+        UTF-8 sequences, which encrypt_text would fold). The buffers are
+        accessed through NumPy views and the substitution cache, so no object
+        is created per character. Returns the number of letters encrypted and
+        the rotor positions after the last key press.
+
+        Buffers shorter than STATE_COUNT walk the stepping table for just the
+        key presses they need; longer ones index the whole stepping cycle.
+        """
+        source = np.frombuffer(data, dtype=np.uint8)
+        target = np.frombuffer(data if out is None else out, dtype=np.uint8)
+        if not target.flags.writeable:
+            raise TypeError("Output buffer is read-only")
+        if len(target) < len(source):
+            raise ValueError("Output buffer is shorter than the input")
+        state = state_index(positions)
+        cycle = stepping_cycle(self.notches[0], self.notches[1], state) if len(source) >= STATE_COUNT else None
+        substitutions = np.frombuffer(self._substitutions, dtype=np.uint8)
+        letters = 0
+        for start in range(0, len(source), BUFFER_CHUNK):
+            chunk = source[start:start + BUFFER_CHUNK]
+            folded = (chunk | 0x20).astype(np.intp) - ord('a')
+            where = np.flatnonzero((folded >= 0) & (folded < 26) & (chunk < 0x80))
+            if cycle is None:
+                next_state = self.next_state
+                walked = []
+                for _ in range(len(where)):
+                    state = next_state[state]
+                    walked.append(state)
+                k = np.array(walked, dtype=np.intp)
+            else:
+                states = cycle.state_array
+                presses = np.arange(letters + 1, letters + len(where) + 1)
+                looped = presses >= len(states)
+                presses[looped] = cycle.cycle_start + (presses[looped] - cycle.cycle_start) % cycle.period
+                k = states[presses]
+            for unbuilt in np.unique(k[substitutions[k * 26] == UNBUILT]):
+                self._build(int(unbuilt))
+            if out is not None:
+                target[start:start + len(chunk)] = chunk
+            target[start + where] = substitutions[k * 26 + folded[where]] + ord('A')
+            letters += len(where)
+        return letters, cycle.positions_after(letters) if cycle is not None else state_positions(state)
+
+
+def fold_letter(char: str) -> Tuple[int, bool]:
+    """Map a non-ASCII alphabetic character the way the component path does.
+
+    Returns the letter index and whether the entry plugboard applies to it.
+    """
+    pos = ord(char.upper()) - ord('A')
+    if 0 <= pos < 26:
+        return pos, True
+    return pos % 26, False
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def compile_config(key: EngineKey) -> CompiledEnigma:
+    """Compile a configuration key into integer tables (cached, LRU-evicted)."""
+    rotor_specs, reflector_wiring, plug_pairs = key
+    if len(rotor_specs) != 3:
+        raise ValueError("Exactly 3 rotors are required")
+    forward, backward = zip(*(rotor_tables(wiring, ring) for wiring, _, ring in rotor_specs))
+    return CompiledEnigma(
+        forward=tuple(forward),
+        backward=tuple(backward),
+        reflector=translation(wiring_table(reflector_wiring) if reflector_wiring else range(26)),
+        plugboard=translation(plugboard_table(plug_pairs)),
+        next_state=stepping_table(rotor_specs[1][1], rotor_specs[2][1]),
+        notches=(rotor_specs[1][1], rotor_specs[2][1]),
+        ring_settings=tuple(ring % 26 for _, _, ring in rotor_specs),
+        scrambler=_scrambler_table(rotor_specs, reflector_wiring),
+    )
+
+
+def _scrambler_table(rotor_specs: Sequence[RotorSpec], reflector_wiring: Optional[str]):
+    """The shared precomputed table for standard rotors and reflector, if it has been built.
+
+    Looked up when a configuration is compiled, so engines compiled before the
+    table file existed keep composing their tables from the wirings.
+    """
+    names = [_ROTOR_BY_WIRING.get(wiring) for wiring, _, _ in rotor_specs]
+    reflector = _REFLECTOR_BY_WIRING.get(reflector_wiring)
+    if None in names or reflector is None:
+        return None
+    return shared_table(names, reflector)
+
+
+def compile_machine(rotors: Sequence[Rotor], reflector: Optional[Reflector], plugboard: Plugboard) -> CompiledEnigma:
+    """Compile rotors, reflector and plugboard into integer tables."""
+    return compile_config(config_key(rotors, reflector, plugboard))
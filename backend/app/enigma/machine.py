@@ -1,5 +1,7 @@
 from typing import List, Optional
 from .components import Rotor, Reflector, Plugboard, ROTOR_WIRINGS, ROTOR_NOTCHES, REFLECTOR_WIRINGS
+from .engine import CompiledEnigma, EngineKey, Positions, compile_config, config_key
+from .parallel import encrypt_parallel
 
 class EnigmaMachine:
     """Main Enigma machine class that combines all components."""
@@ -9,6 +11,9 @@ class EnigmaMachine:
         self.reflector: Optional[Reflector] = None
         self.plugboard = Plugboard()
         self._initial_positions: List[int] = []  # Store initial positions
+        self._engine: Optional[CompiledEnigma] = None
+        self._engine_key: Optional[EngineKey] = None
+        self._engine_source: Optional[tuple] = None  # Configuration the engine key was computed from
 
     def set_rotors(self, rotor_names: List[str], positions: List[int], ring_settings: List[int]) -> bool:
         """Set up the rotors with their positions and ring settings."""
@@ -47,41 +52,114 @@ class EnigmaMachine:
         """Remove a connection from the plugboard."""
         return self.plugboard.remove_connection(char)
 
+    def apply_settings(self, settings: dict) -> bool:
+        """Configure the machine from a dict in the format of get_current_settings().
+
+        Rotor positions in the dict become the new initial positions.
+        """
+        rotors = settings.get("rotors") or []
+        if not self.set_rotors(
+            rotor_names=[r["name"] for r in rotors],
+            positions=[r["position"] for r in rotors],
+            ring_settings=[r["ring_setting"] for r in rotors]
+        ):
+            return False
+        if not self.set_reflector(settings.get("reflector") or ""):
+            return False
+        self.plugboard = Plugboard()
+        for char1, char2 in (settings.get("plugboard") or {}).items():
+            if self.plugboard.connections.get(char1.upper()) == char2.upper():
+                continue  # Connections are stored in both directions
+            if not self.add_plugboard_connection(char1, char2):
+                return False
+        return True
+
     def encrypt_char(self, char: str) -> str:
         """Encrypt a single character through the Enigma machine."""
         if not char.isalpha():
             return char
 
-        # Rotate rotors
-        self._rotate_rotors()
-
-        # Pass through plugboard
-        char = self.plugboard.encrypt(char)
-
-        # Forward through rotors
-        for rotor in self.rotors:
-            char = rotor.encrypt_forward(char)
-
-        # Through reflector
-        if self.reflector:
-            char = self.reflector.reflect(char)
-
-        # Backward through rotors
-        for rotor in reversed(self.rotors):
-            char = rotor.encrypt_backward(char)
-
-        # Back through plugboard
-        char = self.plugboard.encrypt(char)
-
+        engine = self.compiled()
+        char, positions = engine.encrypt_char(char, self._positions())
+        self._store_positions(positions)
         return char
 
-    def encrypt_message(self, message: str) -> str:
-        """Encrypt a message through the Enigma machine."""
-        # Reset rotors to initial positions
-        for rotor, pos in zip(self.rotors, self._initial_positions):
+    def encrypt_message(self, message: str, offset: int = 0, parallel: bool = False) -> str:
+        """Encrypt a message through the Enigma machine.
+
+        ``offset`` is the number of letters already typed before ``message``, so a
+        slice of a longer message can be processed without replaying its start.
+        With ``parallel`` set, very long messages are split into chunks that are
+        encrypted on a process pool (short ones are still encrypted serially).
+        """
+        self.seek(offset)
+        if parallel:
+            self.compiled()
+            encrypted, positions = encrypt_parallel(self._engine_key, self._positions(), message)
+        else:
+            encrypted, positions = self.compiled().encrypt_text(message, self._positions())
+        self._store_positions(positions)
+        return encrypted
+
+    def encrypt_buffer(self, data, out=None, offset: int = 0) -> int:
+        """Encrypt ASCII bytes into ``out``, or in place when no output buffer is given.
+
+        Byte-oriented counterpart of encrypt_message for large inputs: accepts
+        any buffer (bytes, bytearray, memoryview, mmap, ...) and allocates
+        nothing per character. Returns the number of letters encrypted.
+        """
+        self.seek(offset)
+        letters, positions = self.compiled().encrypt_buffer(data, self._positions(), out)
+        self._store_positions(positions)
+        return letters
+
+    def positions_after(self, key_presses: int) -> List[int]:
+        """Rotor positions after the given number of key presses from the initial positions."""
+        initial = tuple(pos % 26 for pos in self._initial_positions)
+        return list(self.compiled().positions_after(initial, key_presses))
+
+    def seek(self, key_presses: int):
+        """Move the rotors to where they are after the given number of key presses."""
+        if key_presses == 0:
+            # Reset rotors to initial positions
+            for rotor, pos in zip(self.rotors, self._initial_positions):
+                rotor.current_position = pos
+            return
+        self._store_positions(tuple(self.positions_after(key_presses)))
+
+    def compiled(self) -> CompiledEnigma:
+        """Return the integer-table engine for the current configuration.
+
+        Engines are shared between machines through a bounded LRU cache keyed by
+        rotors, rings, reflector and plugboard, so substitution tables built for
+        one machine are reused by every other machine with the same key. Changes
+        made through the public attributes are picked up too; the (sorted) key is
+        only recomputed when an unsorted snapshot of the configuration differs.
+        """
+        source = self._configuration()
+        if self._engine is None or source != self._engine_source:
+            self._engine_key = config_key(self.rotors, self.reflector, self.plugboard)
+            self._engine = compile_config(self._engine_key)
+            self._engine_source = (source[0], source[1], dict(source[2]))
+        return self._engine
+
+    def _configuration(self) -> tuple:
+        """Everything config_key depends on, without sorting the plugboard."""
+        return (
+            [(r.wiring, tuple(r.notch_positions), r.ring_setting) for r in self.rotors],
+            self.reflector.wiring if self.reflector else None,
+            self.plugboard.connections,
+        )
+
+    def _positions(self) -> Positions:
+        """Current rotor positions as a tuple of ints (0-25)."""
+        p0, p1, p2 = (rotor.current_position % 26 for rotor in self.rotors)
+        return p0, p1, p2
+
+    def _store_positions(self, positions: Positions):
+        """Write positions computed by the engine back to the rotor objects."""
+        for rotor, pos in zip(self.rotors, positions):
             rotor.current_position = pos
-        
-        return ''.join(self.encrypt_char(c) for c in message)
 
     def _rotate_rotors(self):
         """Rotate the rotors according to Enigma rules."""
@@ -0,0 +1,73 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import atexit
+import os
+import string
+import threading
+
+from .engine import EngineKey, Positions, compile_config
+
+# Messages shorter than this (in characters) are encrypted serially
+PARALLEL_THRESHOLD = int(os.getenv("ENIGMA_PARALLEL_THRESHOLD", "1000000"))
+# Smallest chunk handed to a worker process
+MIN_CHUNK_SIZE = 256 * 1024
+# Worker processes in the shared pool (defaults to the number of CPUs)
+PARALLEL_WORKERS = int(os.getenv("ENIGMA_PARALLEL_WORKERS", "0")) or os.cpu_count() or 1
+
+_DELETE_LETTERS = str.maketrans('', '', string.ascii_letters)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def count_letters(text: str) -> int:
+    """Number of key presses (ASCII letters) in a text."""
+    return len(text) - len(text.translate(_DELETE_LETTERS))
+
+
+def split_chunks(text: str, chunks: int) -> List[str]:
+    """Split a text into at most ``chunks`` pieces of at least MIN_CHUNK_SIZE characters."""
+    size = max(MIN_CHUNK_SIZE, -(-len(text) // max(chunks, 1)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _encrypt_chunk(key: EngineKey, positions: Positions, text: str) -> str:
+    """Worker entry point: encrypt one chunk from a known start position."""
+    return compile_config(key).encrypt_text(text, positions)[0]
+
+
+def encrypt_parallel(key: EngineKey, positions: Positions, text: str,
+                     executor: Optional[Executor] = None,
+                     threshold: int = PARALLEL_THRESHOLD) -> Tuple[str, Positions]:
+    """Encrypt a long text by splitting it into chunks encrypted on a process pool.
+
+    Each chunk's start positions are computed directly with jump-ahead stepping,
+    so chunks are independent. Texts below ``threshold`` characters, and texts
+    containing non-ASCII characters (where counting key presses per chunk is not
+    a simple translate), are encrypted serially in this process.
+    Returns the ciphertext and the rotor positions after the last key press.
+    """
+    engine = compile_config(key)
+    if len(text) < threshold or not text.isascii():
+        return engine.encrypt_text(text, positions)
+
+    executor = executor or get_pool()
+    chunks = split_chunks(text, PARALLEL_WORKERS * 4)
+    futures = []
+    key_presses = 0
+    for chunk in chunks:
+        start = engine.positions_after(positions, key_presses)
+        futures.append(executor.submit(_encrypt_chunk, key, start, chunk))
+        key_presses += count_letters(chunk)
+    encrypted = ''.join(future.result() for future in futures)
+    return encrypted, engine.positions_after(positions, key_presses)
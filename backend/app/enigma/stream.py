@@ -0,0 +1,84 @@
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Iterable, Iterator, TextIO, Union
+import codecs
+
+from .machine import EnigmaMachine
+
+Chunk = Union[str, bytes]
+
+# Characters (or bytes) read per call when encrypting file objects
+READ_SIZE = 64 * 1024
+
+
+class StreamEncryptor:
+    """Encrypts unbounded input chunk by chunk, carrying rotor state across chunks.
+
+    Only the current rotor positions are kept between chunks, so memory use does
+    not depend on the length of the input. ``bytes`` chunks are decoded as UTF-8
+    incrementally (a multi-byte character may be split across chunks) and
+    encrypted chunks are returned as ``bytes``; undecodable bytes pass through
+    unchanged.
+    """
+
+    def __init__(self, machine: EnigmaMachine, offset: int = 0):
+        self._engine = machine.compiled()
+        self.positions = tuple(machine.positions_after(offset))
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="surrogateescape")
+
+    def encrypt(self, chunk: Chunk) -> Chunk:
+        """Encrypt the next chunk of the stream."""
+        if isinstance(chunk, str):
+            return self._encrypt_text(chunk)
+        text = self._decoder.decode(bytes(chunk))
+        return self._encrypt_text(text).encode("utf-8", errors="surrogateescape")
+
+    def flush(self) -> bytes:
+        """Return whatever is left of an incomplete UTF-8 sequence at the end of a byte stream."""
+        text = self._decoder.decode(b"", final=True)
+        return self._encrypt_text(text).encode("utf-8", errors="surrogateescape")
+
+    def _encrypt_text(self, text: str) -> str:
+        encrypted, self.positions = self._engine.encrypt_text(text, self.positions)
+        return encrypted
+
+    def iter_encrypt(self, chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+        """Encrypt an iterable of chunks lazily, yielding one encrypted chunk per input chunk."""
+        binary = False
+        for chunk in chunks:
+            binary = not isinstance(chunk, str)
+            encrypted = self.encrypt(chunk)
+            if encrypted:
+                yield encrypted
+        tail = self.flush()
+        if binary and tail:
+            yield tail
+
+    async def aiter_encrypt(self, chunks: AsyncIterable[Chunk]) -> AsyncIterator[Chunk]:
+        """Async version of iter_encrypt for async iterables (e.g. request bodies)."""
+        binary = False
+        async for chunk in chunks:
+            binary = not isinstance(chunk, str)
+            encrypted = self.encrypt(chunk)
+            if encrypted:
+                yield encrypted
+        tail = self.flush()
+        if binary and tail:
+            yield tail
+
+    def encrypt_file(self, source: Union[TextIO, BinaryIO], target: Union[TextIO, BinaryIO],
+                     read_size: int = READ_SIZE) -> int:
+        """Encrypt a file object or pipe into another without loading it into memory.
+
+        Text and binary file objects are both supported. Returns the number of
+        characters (or bytes) read from ``source``.
+        """
+        total = 0
+
+        def blocks() -> Iterator[Chunk]:
+            nonlocal total
+            for block in iter(lambda: source.read(read_size), source.read(0)):
+                total += len(block)
+                yield block
+
+        for chunk in self.iter_encrypt(blocks()):
+            target.write(chunk)  # type: ignore[arg-type]
+        return total
@@ -0,0 +1,170 @@
+"""
+Precomputed scrambler permutation tables, memory-mapped from disk.
+
+The scrambler (three rotors and reflector, no plugboard) at any key press is
+fixed by the rotor order, the reflector and the three rotor shifts
+(position - ring setting), so one table per rotor order and reflector holds
+all 17,576 of them: 60 orders x 3 reflectors x 17,576 x 26 bytes, about 82 MB.
+Built once from ROTOR_WIRINGS/REFLECTOR_WIRINGS, the file is opened with
+np.memmap, so every uvicorn and solver process shares the page cache and
+starts without recomputing anything. Encrypting a letter is then one lookup
+instead of seven; the compiled engine, the batch search kernels, the bombe and
+the indicator attacks all use the tables when the file exists.
+
+File layout (little-endian): 12-byte header (magic, length of the JSON list
+of rotor orders, length of the JSON list of reflectors), both JSON lists, then
+uint8 permutations [order][reflector][shift index][letter] starting at a
+64-byte boundary; the shift index is s0 * 676 + s1 * 26 + s2, as in ALL_POSITIONS.
+"""
+from itertools import permutations
+from typing import Dict, Iterable, Optional, Sequence
+import json
+import os
+import struct
+
+import numpy as np
+
+from .batch import ALL_POSITIONS, BACKWARD_SHIFTED, FORWARD_SHIFTED, NOTCH, REFLECT, REFLECTOR_NAMES, ROTOR_NAMES
+
+TABLES_PATH = os.getenv("PERMUTATION_TABLES", "data/permutation_tables.bin")
+TABLES_MAGIC = b"ENPT"
+TABLES_HEADER = struct.Struct("<4sII")
+TABLES_ALIGNMENT = 64
+
+
+def scrambler_table(rotor_order: Sequence[int], reflector: int) -> np.ndarray:
+    """(17576, 26) scrambler permutations for every shift triple of one rotor order and reflector."""
+    o0, o1, o2 = (int(o) for o in rotor_order)
+    s0, s1, s2 = (ALL_POSITIONS[:, i, None] for i in range(3))
+    c = np.broadcast_to(np.arange(26), (len(ALL_POSITIONS), 26))
+    c = FORWARD_SHIFTED[o2][s2, FORWARD_SHIFTED[o1][s1, FORWARD_SHIFTED[o0][s0, c]]]
+    c = REFLECT[int(reflector)][c]
+    c = BACKWARD_SHIFTED[o0][s0, BACKWARD_SHIFTED[o1][s1, BACKWARD_SHIFTED[o2][s2, c]]]
+    return c.astype(np.uint8)
+
+
+class PermutationTables:
+    """Scrambler tables for a set of rotor orders and reflectors, shape (orders, reflectors, 17576, 26)."""
+
+    def __init__(self, orders: Sequence[Sequence[str]], reflectors: Sequence[str], tables: np.ndarray):
+        self.orders = [tuple(order) for order in orders]
+        self.reflectors = list(reflectors)
+        self.tables = tables
+        self._order_index = {order: i for i, order in enumerate(self.orders)}
+
+    @classmethod
+    def build(cls, orders: Optional[Iterable[Sequence[str]]] = None,
+              reflectors: Optional[Iterable[str]] = None) -> "PermutationTables":
+        """Compute the tables (every order of the known rotors and every reflector by default)."""
+        orders = [tuple(order) for order in (orders or permutations(ROTOR_NAMES, 3))]
+        reflectors = list(reflectors or REFLECTOR_NAMES)
+        tables = np.empty((len(orders), len(reflectors), len(ALL_POSITIONS), 26), dtype=np.uint8)
+        for i, order in enumerate(orders):
+            indices = [ROTOR_NAMES.index(name) for name in order]
+            for j, reflector in enumerate(reflectors):
+                tables[i, j] = scrambler_table(indices, REFLECTOR_NAMES.index(reflector))
+        return cls(orders, reflectors, tables)
+
+    @classmethod
+    def open(cls, path: str = TABLES_PATH) -> "PermutationTables":
+        """Memory-map tables written by save()."""
+        with open(path, "rb") as f:
+            magic, orders_length, reflectors_length = TABLES_HEADER.unpack(f.read(TABLES_HEADER.size))
+            if magic != TABLES_MAGIC:
+                raise ValueError(f"{path} is not a permutation table file")
+            orders = json.loads(f.read(orders_length))
+            reflectors = json.loads(f.read(reflectors_length))
+        start = _data_offset(orders_length, reflectors_length)
+        tables = np.memmap(path, dtype=np.uint8, mode="r", offset=start,
+                           shape=(len(orders), len(reflectors), len(ALL_POSITIONS), 26))
+        return cls(orders, reflectors, tables)
+
+    def save(self, path: str = TABLES_PATH):
+        """Write the tables in the layout read by open().
+
+        The file is written under a temporary name and renamed into place, so
+        shared_tables() in a running process never maps a partial file.
+        """
+        orders = json.dumps(self.orders).encode()
+        reflectors = json.dumps(self.reflectors).encode()
+        start = _data_offset(len(orders), len(reflectors))
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(TABLES_HEADER.pack(TABLES_MAGIC, len(orders), len(reflectors)))
+            f.write(orders + reflectors)
+            f.write(b"\0" * (start - TABLES_HEADER.size - len(orders) - len(reflectors)))
+            f.write(np.ascontiguousarray(self.tables, dtype=np.uint8).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def table(self, order: Sequence[str], reflector: str) -> Optional[np.ndarray]:
+        """The (17576, 26) table of one rotor order and reflector, or None if it is not included."""
+        i = self._order_index.get(tuple(order))
+        if i is None or reflector not in self.reflectors:
+            return None
+        return self.tables[i, self.reflectors.index(reflector)]
+
+
+def _data_offset(orders_length: int, reflectors_length: int) -> int:
+    end = TABLES_HEADER.size + orders_length + reflectors_length
+    return end + (-end % TABLES_ALIGNMENT)
+
+
+_opened: Dict[str, PermutationTables] = {}
+
+
+def shared_tables(path: str = TABLES_PATH) -> Optional[PermutationTables]:
+    """The table file mapped once per process, or None until the build step has written it.
+
+    Only successful opens are cached, so long-running processes pick up a
+    file built after they started.
+    """
+    tables = _opened.get(path)
+    if tables is None and os.path.exists(path):
+        tables = _opened[path] = PermutationTables.open(path)
+    return tables
+
+
+def shared_table(order: Sequence[str], reflector: str) -> Optional[np.ndarray]:
+    """The shared (17576, 26) table of one rotor order and reflector, if it has been built."""
+    tables = shared_tables()
+    return tables.table(order, reflector) if tables is not None else None
+
+
+def encrypt_table(table: np.ndarray, rotor_order: Sequence[int], ring_settings: Sequence[int],
+                  plugboard: np.ndarray, positions: np.ndarray, letters: np.ndarray) -> np.ndarray:
+    """encrypt_positions using a precomputed scrambler table: one gather per letter.
+
+    ``ring_settings`` is shared (3,) or one row per position (B, 3).
+    """
+    notch_middle, notch_right = NOTCH[int(rotor_order[1])], NOTCH[int(rotor_order[2])]
+    rings = np.asarray(ring_settings, dtype=np.intp) % 26
+    r0, r1, r2 = rings[..., 0], rings[..., 1], rings[..., 2]
+    plug = np.asarray(plugboard, dtype=np.intp)
+    flat = np.asarray(table).ravel()
+    p = np.asarray(positions, dtype=np.intp) % 26
+    p0, p1, p2 = p[:, 0].copy(), p[:, 1].copy(), p[:, 2].copy()
+
+    out = np.empty((len(p), len(letters)), dtype=np.uint8)
+    for j, letter in enumerate(np.asarray(letters, dtype=np.intp)):
+        middle = notch_middle[p1]
+        right = notch_right[p2]
+        p0 = (p0 + middle) % 26
+        p1 = (p1 + (middle | right)) % 26
+        p2 = (p2 + 1) % 26
+        shift = ((p0 - r0) % 26 * 26 + (p1 - r1) % 26) * 26 + (p2 - r2) % 26
+        out[:, j] = plug[flat[shift * 26 + plug[letter]]]
+    return out
+
+
+def main():
+    """Build the table file: python -m app.enigma.tables [path]"""
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else TABLES_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    PermutationTables.build().save(path)
+
+
+if __name__ == "__main__":
+    main()
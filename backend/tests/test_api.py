@@ -1,8 +1,14 @@
+import pytest
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, ip_request_times
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def reset_rate_limit():
+    """Keep the per-IP rate limit from spilling over between tests."""
+    ip_request_times.clear()
+
 def test_root():
     """Test the root endpoint."""
     response = client.get("/")
@@ -102,4 +108,301 @@ def test_enigma_roundtrip():
     decrypted = response.json()["encrypted"]
     
     # The decrypted message should match the original
-    assert decrypted == original 
\ No newline at end of file
+    assert decrypted == original
+
+def test_streaming_encryption():
+    """Test that the streaming endpoint matches the JSON encrypt endpoint."""
+    settings = {
+        "rotors": [
+            {"name": "I", "position": 3, "ring_setting": 1},
+            {"name": "II", "position": 4, "ring_setting": 2},
+            {"name": "III", "position": 5, "ring_setting": 3}
+        ],
+        "reflector": "B",
+        "plugboard": {"A": "B", "C": "D"}
+    }
+    text = "Streaming works even for long messages. " * 200
+    client.post("/settings", json=settings)
+    expected = client.post("/encrypt", json={"text": text}).json()["encrypted"]
+
+    client.post("/settings", json=settings)
+    chunks = (text[i:i + 333].encode() for i in range(0, len(text), 333))
+    response = client.post("/encrypt/stream", content=chunks)
+    assert response.status_code == 200
+    assert response.text == expected
+
+def test_batch_encryption():
+    """Test the batch endpoint with valid and invalid items."""
+    settings = {
+        "rotors": [
+            {"name": "II", "position": 1, "ring_setting": 2},
+            {"name": "V", "position": 3, "ring_setting": 4},
+            {"name": "I", "position": 5, "ring_setting": 6}
+        ],
+        "reflector": "C",
+        "plugboard": {"E": "Z"}
+    }
+    invalid = dict(settings, reflector="X")
+    items = [
+        {"settings": settings, "text": "FIRST MESSAGE"},
+        {"settings": invalid, "text": "BROKEN"},
+        {"settings": settings, "text": "Über Bletchley Park"},
+    ]
+    response = client.post("/encrypt/batch", json={"items": items})
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 3
+    assert results[1]["encrypted"] is None and "reflector" in results[1]["error"]
+
+    for item, result in zip([items[0], items[2]], [results[0], results[2]]):
+        assert result["error"] is None
+        client.post("/settings", json=settings)
+        expected = client.post("/encrypt", json={"text": item["text"]}).json()["encrypted"]
+        assert result["encrypted"] == expected
+
+    # Text length is capped per item and over the whole batch
+    from app.api.enigma import MAX_BATCH_TEXT_LENGTH, MAX_BATCH_TOTAL_LENGTH
+    long_item = {"settings": settings, "text": "A" * (MAX_BATCH_TEXT_LENGTH + 1)}
+    response = client.post("/encrypt/batch", json={"items": [items[0], long_item]})
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0]["error"] is None and "limited" in results[1]["error"]
+    count = MAX_BATCH_TOTAL_LENGTH // MAX_BATCH_TEXT_LENGTH + 1
+    response = client.post("/encrypt/batch", json={"items": [dict(long_item, text="A" * MAX_BATCH_TEXT_LENGTH)] * count})
+    assert response.status_code == 400
+
+def test_sessions_are_isolated():
+    """Test that clients with different session tokens do not share settings."""
+    settings = {
+        "rotors": [
+            {"name": "I", "position": 0, "ring_setting": 0},
+            {"name": "II", "position": 0, "ring_setting": 0},
+            {"name": "III", "position": 0, "ring_setting": 0}
+        ],
+        "reflector": "B",
+        "plugboard": {}
+    }
+    first = TestClient(app)
+    second = TestClient(app)
+    response = first.post("/settings", json=settings)
+    token = response.headers["X-Session-Token"]
+    assert response.cookies.get("enigma_session") == token
+
+    # The second client has its own (empty) session
+    assert second.get("/settings").json()["rotors"] == []
+    assert second.post("/encrypt", json={"text": "HELLO"}).status_code == 400
+
+    # The header works as well as the cookie
+    headers = {"X-Session-Token": token}
+    assert len(second.get("/settings", headers=headers).json()["rotors"]) == 3
+    assert first.post("/encrypt", json={"text": "HELLO"}).status_code == 200
+
+def test_inline_encryption_uses_machine_cache():
+    """Test stateless encryption with inline settings and the machine cache."""
+    from app.api.enigma import machine_cache
+
+    settings = {
+        "rotors": [
+            {"name": "III", "position": 7, "ring_setting": 1},
+            {"name": "I", "position": 8, "ring_setting": 2},
+            {"name": "IV", "position": 9, "ring_setting": 3}
+        ],
+        "reflector": "B",
+        "plugboard": {"P": "O"}
+    }
+    text = "NO SERVER STATE NEEDED"
+    response = client.post("/encrypt/inline", json={"settings": settings, "text": text})
+    assert response.status_code == 200
+    encrypted = response.json()["encrypted"]
+
+    # Equivalent settings (other plugboard direction, position + 26) hit the cache
+    hits = machine_cache.hits
+    same = dict(settings, plugboard={"O": "P"})
+    same["rotors"] = [dict(settings["rotors"][0], position=33)] + settings["rotors"][1:]
+    response = client.post("/encrypt/inline", json={"settings": same, "text": encrypted})
+    assert response.json()["encrypted"] == text
+    assert machine_cache.hits == hits + 1
+
+    invalid = dict(settings, plugboard={"P": "P"})
+    response = client.post("/encrypt/inline", json={"settings": invalid, "text": text})
+    assert response.status_code == 400
+
+    # A pair listed in both directions is rejected even though its hash is cached
+    duplicate = dict(settings, plugboard={"P": "O", "O": "P"})
+    response = client.post("/encrypt/inline", json={"settings": duplicate, "text": text})
+    assert response.status_code == 400
+
+    # Entries hold engine keys; engines come from the shared compile_config cache
+    from app.enigma.engine import compile_config
+    key, (engine, _) = machine_cache.get(settings, None)
+    assert engine is compile_config(machine_cache._entries[key][0])
+
+def test_cracking_jobs():
+    """Test submitting, streaming, polling and cancelling background cracking jobs."""
+    import json
+    from app.enigma.machine import EnigmaMachine
+
+    machine = EnigmaMachine()
+    machine.set_rotors(["II", "I", "III"], [4, 11, 19], [0, 0, 0])
+    machine.set_reflector("B")
+    ciphertext = machine.encrypt_message("THE CODEBREAKERS AT BLETCHLEY PARK WORKED DAY AND NIGHT TO READ THESE MESSAGES")
+
+    with TestClient(app) as job_client:
+        request = {
+            "kind": "rotor_search",
+            "ciphertext": ciphertext,
+            "rotor_orders": [["I", "II", "III"], ["II", "I", "III"]],
+            "reflectors": ["B"],
+            "top_k": 3,
+        }
+        response = job_client.post("/jobs", json=request)
+        assert response.status_code == 200
+        job_id = response.json()["id"]
+
+        with job_client.stream("GET", f"/jobs/{job_id}/events") as events:
+            updates = [json.loads(line) for line in events.iter_lines() if line]
+        final = updates[-1]
+        assert final["status"] == "done"
+        assert final["keys_tested"] == final["keys_total"] == 2 * 26 ** 3
+        best = final["best"][0]["settings"]
+        assert [r["name"] for r in best["rotors"]] == ["II", "I", "III"]
+        assert [r["position"] for r in best["rotors"]] == [4, 11, 19]
+        assert job_client.get(f"/jobs/{job_id}").json()["status"] == "done"
+
+        # Jobs are private to the session that submitted them
+        assert TestClient(app).get(f"/jobs/{job_id}").status_code == 404
+
+        response = job_client.post("/jobs", json=dict(request, rotor_orders=None, reflectors=None))
+        cancelled = job_client.delete(f"/jobs/{response.json()['id']}").json()
+        assert cancelled["status"] == "cancelled"
+        assert cancelled["tasks_done"] < cancelled["tasks_total"]
+
+        assert job_client.post("/jobs", json={"kind": "unknown"}).status_code == 400
+        assert job_client.post("/jobs", json=dict(request, ciphertext="A" * 1001)).status_code == 400
+        assert job_client.post("/jobs", json={"kind": "challenge", "challenge_id": 99}).status_code == 404
+
+def test_session_backends_expire_and_evict():
+    """Test TTL expiry and size-bounded eviction of session backends."""
+    import time
+    from app.api.sessions import InMemorySessionBackend, KeyValueSessionBackend, LocalKeyValueClient
+
+    memory = InMemorySessionBackend(ttl=60, max_entries=2)
+    for token in ("a", "b", "c"):
+        memory.set(token, {"token": token})
+    assert len(memory) == 2
+    assert memory.get("a") is None
+    assert memory.get("c") == {"token": "c"}
+
+    store = LocalKeyValueClient()
+    with pytest.raises(ValueError):
+        store.set("a", "{}", ex=0)  # Redis rejects expire times that are not positive
+    shared = KeyValueSessionBackend(store, ttl=1)
+    shared.set("a", {"rotors": []})
+    time.sleep(0.6)
+    assert shared.get("a") == {"rotors": []}  # Refreshes the TTL
+    time.sleep(0.6)
+    assert shared.get("a") == {"rotors": []}
+    time.sleep(1.1)
+    assert shared.get("a") is None
+
+    class RacingClient(LocalKeyValueClient):
+        """Another worker updates the session right after every read."""
+
+        def get(self, name):
+            value = super().get(name)
+            self.set(name, '{"rotors": ["updated"]}', ex=60)
+            return value
+
+    racing = KeyValueSessionBackend(RacingClient(), ttl=60)
+    racing.set("a", {"rotors": []})
+    assert racing.get("a") == {"rotors": []}
+    assert LocalKeyValueClient.get(racing.client, racing.prefix + "a") == b'{"rotors": ["updated"]}'
+
+def test_large_requests_are_offloaded():
+    """Work above the threshold runs on the offload pool; a full queue is rejected."""
+    import asyncio
+    from app.api import enigma as enigma_api
+    from app.api.offload import OffloadBusy, Offloader
+
+    settings = {
+        "rotors": [{"name": "I", "position": 0, "ring_setting": 0},
+                   {"name": "II", "position": 0, "ring_setting": 0},
+                   {"name": "III", "position": 0, "ring_setting": 0}],
+        "reflector": "B",
+        "plugboard": {},
+    }
+    offloaded = enigma_api.offloader.offloaded
+    small = client.post("/encrypt/inline", json={"settings": settings, "text": "HELLO"})
+    large = client.post("/encrypt/inline", json={"settings": settings, "text": "HELLO" * 10000})
+    assert large.json()["encrypted"][:5] == small.json()["encrypted"]
+    stats = client.get("/metrics").json()["offload"]
+    assert stats["offloaded"] == offloaded + 1
+    assert stats["queue_depth"] == 0
+
+    # Non-ASCII batch items count towards the work and run on the pool too
+    items = [{"settings": settings, "text": "Über " * 2000}] * 3
+    results = client.post("/encrypt/batch", json={"items": items}).json()
+    assert all(result["encrypted"] for result in results)
+    assert client.get("/metrics").json()["offload"]["offloaded"] == offloaded + 2
+
+    async def saturate():
+        offloader = Offloader(workers=1, threshold=10, max_queue=1)
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def blocking():
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+            return "done"
+
+        running = asyncio.ensure_future(offloader.run(100, blocking))
+        queued = asyncio.ensure_future(offloader.run(100, str.upper, "queued"))
+        await asyncio.sleep(0.05)
+        assert offloader.stats()["queue_depth"] == 1
+        assert await offloader.run(1, str.upper, "inline") == "INLINE"
+        with pytest.raises(OffloadBusy):
+            await offloader.run(100, str.upper, "rejected")
+        # A cancelled request keeps its slot until the worker thread returns
+        running.cancel()
+        await asyncio.sleep(0.05)
+        assert offloader.stats()["running"] == 1 and offloader.stats()["queue_depth"] == 1
+        release.set()
+        return await queued
+
+    assert asyncio.run(saturate()) == "QUEUED"
+
+def test_cancelled_jobs_keep_their_slot_until_the_worker_returns():
+    """Cancelling does not free pool slots early, and limits apply per client address."""
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from app.api.jobs import JobManager
+
+    release = threading.Event()
+
+    def wait_for_release():
+        release.wait()
+        return []  # No candidates
+
+    async def scenario():
+        manager = JobManager(workers=1, max_jobs_per_client=2, executor=ThreadPoolExecutor(1))
+        blocking = (wait_for_release, ())
+        job = manager.submit("token-1", "10.0.0.1", "test", [blocking, blocking], 0)
+        await asyncio.sleep(0.05)
+        manager.cancel(job)
+        assert job.status == "cancelled" and manager.running == 1
+
+        # A fresh session token does not reset the client's limit
+        manager.submit("token-2", "10.0.0.1", "test", [blocking], 0)
+        with pytest.raises(ValueError):
+            manager.submit("token-3", "10.0.0.1", "test", [blocking], 0)
+        other = manager.submit("token-4", "10.0.0.2", "test", [blocking], 0)
+        assert other.status == "queued"
+
+        release.set()
+        while manager.running or manager.queue_depth():
+            await asyncio.sleep(0.01)
+        return job, other
+
+    job, other = asyncio.run(scenario())
+    assert job.tasks_done == 0
+    assert other.status == "done"
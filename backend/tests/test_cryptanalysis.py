@@ -0,0 +1,259 @@
+import pickle
+
+import numpy as np
+import pytest
+from app.enigma.machine import EnigmaMachine
+from app.cryptanalysis.rotor_search import decrypt, search_rotors
+from app.cryptanalysis.scoring import IndexOfCoincidence, NgramScorer, text_letters
+
+PLAINTEXT = (
+    "THE ENIGMA MACHINE WAS USED BY THE GERMAN MILITARY DURING THE SECOND WORLD WAR TO SEND SECRET "
+    "MESSAGES THE CODEBREAKERS AT BLETCHLEY PARK WORKED DAY AND NIGHT TO READ THESE MESSAGES"
+)
+
+def make_machine(rotors, positions, rings, reflector="B", plugboard=None):
+    machine = EnigmaMachine()
+    machine.set_rotors(rotors, positions, rings)
+    machine.set_reflector(reflector)
+    for a, b in (plugboard or {}).items():
+        machine.add_plugboard_connection(a, b)
+    return machine
+
+def test_scorers():
+    """Test that the scorers prefer language over random letters."""
+    rng = np.random.default_rng(0)
+    english = text_letters(PLAINTEXT)
+    noise = rng.integers(0, 26, size=len(english))
+    batch = np.stack([english, noise])
+
+    ioc = IndexOfCoincidence().score(batch)
+    assert ioc[0] > 0.055 > ioc[1]
+
+    bigrams = NgramScorer.from_corpus(PLAINTEXT * 3, 2)
+    scores = bigrams.score(batch)
+    assert scores[0] > scores[1]
+
+def test_ngram_table_file_is_memory_mapped(tmp_path):
+    """Test that saved n-gram tables reopen memory-mapped and pickle by path."""
+    trigrams = NgramScorer.from_corpus(PLAINTEXT * 3, 3)
+    path = str(tmp_path / "english_3.ngm")
+    trigrams.save(path)
+
+    mapped = NgramScorer.open(path)
+    assert isinstance(mapped.log_probs, np.memmap)
+    assert mapped.n == 3
+    assert np.array_equal(mapped.log_probs, trigrams.log_probs)
+    assert mapped.score_text(PLAINTEXT) == trigrams.score_text(PLAINTEXT)
+
+    payload = pickle.dumps(mapped)
+    assert len(payload) < 1000
+    assert np.array_equal(pickle.loads(payload).log_probs, trigrams.log_probs)
+
+def test_rotor_search_finds_key(monkeypatch):
+    """Test that the ciphertext-only search recovers order, reflector and positions."""
+    from app.cryptanalysis import rotor_search
+
+    ciphertext = make_machine(["IV", "I", "V"], [3, 14, 20], [0, 0, 0]).encrypt_message(PLAINTEXT)
+    candidates = search_rotors(
+        ciphertext,
+        orders=[("I", "II", "III"), ("IV", "I", "V"), ("V", "I", "IV")],
+        reflectors=["B", "C"],
+        top_k=3,
+        workers=2,
+    )
+    best = candidates[0]
+    assert len(candidates) == 3
+    assert (best.rotors, best.positions, best.reflector) == (("IV", "I", "V"), (3, 14, 20), "B")
+    assert decrypt(best, ciphertext) == ''.join(c for c in PLAINTEXT if c.isalpha())
+
+    # Positions are searched in blocks; the running top-k does not depend on the block size
+    letters = text_letters(ciphertext)
+    whole = rotor_search.search_order(letters, ("IV", "I", "V"), "B", (0, 0, 0), top_k=5)
+    monkeypatch.setattr(rotor_search, "SEARCH_BLOCK", 1000)
+    blocked = rotor_search.search_order(letters, ("IV", "I", "V"), "B", (0, 0, 0), top_k=5)
+    assert [c.positions for c in sorted(blocked, reverse=True)] == [c.positions for c in sorted(whole, reverse=True)]
+
+def test_plugboard_solver_recovers_pairs():
+    """Test that hill climbing recovers the plugboard for known rotor settings."""
+    from app.api.challenges import CHALLENGES
+    from app.cryptanalysis.plugboard_solver import default_plugboard_scorer, solve_plugboard
+    from app.cryptanalysis.rotor_search import Candidate
+
+    pairs = {"A": "Q", "E": "Z", "T": "K", "R": "M", "S": "L"}
+    ciphertext = make_machine(["IV", "I", "V"], [3, 14, 20], [0, 0, 0], plugboard=pairs).encrypt_message(PLAINTEXT * 2)
+    bigrams = NgramScorer.from_corpus(' '.join(c["info"] for c in CHALLENGES), 2)
+    rotor_candidate = Candidate(0.0, ("IV", "I", "V"), (3, 14, 20), (0, 0, 0), "B")
+
+    first = solve_plugboard(ciphertext, [rotor_candidate], scorer=bigrams, known_pairs={"A": "Q"},
+                            seed=7, restarts=2, time_budget=30)[0]
+    stats = {}
+    second = solve_plugboard(ciphertext, [rotor_candidate], scorer=bigrams, known_pairs={"A": "Q"},
+                             seed=7, restarts=2, time_budget=30, stats=stats)[0]
+    expected = {frozenset(p) for p in pairs.items()}
+    assert {frozenset(p) for p in first.plugboard.items()} == expected
+    assert first == second and first.plugboard == second.plugboard
+    assert stats["trials"] > 2 * 24 * 23 // 2  # Every cable of the free letters, in both restarts
+
+    # Without a scorer the climb uses n-grams, not single-letter frequencies
+    assert default_plugboard_scorer().n >= 2
+    default = solve_plugboard(ciphertext, [rotor_candidate], known_pairs={"A": "Q"}, seed=7, time_budget=30)[0]
+    assert {frozenset(p) for p in default.plugboard.items()} == expected
+
+def test_bombe_stops_at_the_right_position():
+    """Test that the Bombe stops at the key and reports the implied steckers."""
+    from app.cryptanalysis.bombe import build_menu, run_bombe
+
+    pairs = {"A": "Q", "E": "Z", "T": "K", "R": "M", "S": "L", "W": "X"}
+    machine = make_machine(["IV", "I", "V"], [3, 14, 20], [0, 0, 0], plugboard=pairs)
+    ciphertext = machine.encrypt_message("XXXX WETTERBERICHT FUER DIE NORDSEE HEUTE")
+    menu = build_menu("WETTERBERICHTFUERDIENORDSEE", ciphertext, 4)
+    assert menu.loops()
+    with pytest.raises(ValueError):
+        build_menu("WETTERBERICHT", ciphertext, 100)
+
+    stops = run_bombe(menu, orders=[("IV", "I", "V"), ("I", "II", "III")], reflectors=["B"])
+    assert [stop.positions for stop in stops] == [(3, 14, 20)]
+    assert stops[0].consistent
+    assert {frozenset(p) for p in stops[0].plugboard.items()} == {frozenset(p) for p in pairs.items()}
+
+def test_crib_positions_rule_out_self_encryption():
+    """Test that crib dragging keeps exactly the offsets without a letter clash."""
+    from app.cryptanalysis.cribs import crib_positions, valid_offsets
+
+    cribs = ["WETTERBERICHT", "KEINEBESONDERENEREIGNISSE", "OBERKOMMANDO"]
+    ciphertexts = [
+        make_machine(["I", "II", "III"], [0, 0, i], [0, 0, 0]).encrypt_message(PLAINTEXT)
+        for i in range(4)
+    ] + ["AB"]
+    positions = crib_positions(cribs, ciphertexts)
+    for i, ciphertext in enumerate(ciphertexts):
+        cipher = ''.join(c for c in ciphertext if c.isalpha())
+        for k, crib in enumerate(cribs):
+            expected = [
+                offset for offset in range(len(cipher) - len(crib) + 1)
+                if all(a != b for a, b in zip(crib, cipher[offset:]))
+            ]
+            assert positions[i][k] == expected
+    assert valid_offsets(cribs, ciphertexts).shape[:2] == (5, 3)
+
+def test_rejewski_catalogue_lookup(tmp_path):
+    """Test that indicators from a day's traffic look up the ground setting in a saved catalogue."""
+    from app.cryptanalysis.rejewski import Catalogue, indicator_products
+
+    rng = np.random.default_rng(3)
+    indicators = []
+    for _ in range(200):
+        key = ''.join(chr(ord('A') + int(i)) for i in rng.integers(0, 26, 3))
+        machine = make_machine(["III", "I", "II"], [5, 17, 9], [0, 0, 0], plugboard={"A": "B", "C": "Q"})
+        indicators.append(machine.encrypt_message(key + key))
+    with pytest.raises(ValueError):
+        indicator_products(indicators[:5])
+
+    path = str(tmp_path / "catalogue.bin")
+    Catalogue.build(orders=[("I", "II", "III"), ("III", "I", "II")], reflectors=["B"]).save(path)
+    catalogue = Catalogue.open(path)
+    assert len(catalogue) == 2 * 26 ** 3
+
+    found = catalogue.find(indicators)
+    assert (("III", "I", "II"), (5, 17, 9), "B") in [(c.rotors, c.positions, c.reflector) for c in found]
+    assert len(found) < len(catalogue) // 20
+
+def test_zygalski_sheets_find_ring_settings(tmp_path):
+    """Test that stacking the sheets of a day's females keeps the true rotor order and rings."""
+    from app.cryptanalysis.zygalski import SheetMatch, ZygalskiSheets, females
+
+    rng = np.random.default_rng(5)
+    messages = []
+    while len(females(messages)) < 16:
+        ground = [int(x) for x in rng.integers(0, 26, 3)]
+        key = ''.join(chr(ord('A') + int(i)) for i in rng.integers(0, 26, 3))
+        machine = make_machine(["III", "I", "II"], ground, [2, 5, 11], plugboard={"A": "B", "C": "Q"})
+        messages.append((''.join(chr(ord('A') + g) for g in ground), machine.encrypt_message(key + key)))
+
+    path = str(tmp_path / "sheets.npz")
+    ZygalskiSheets.build(orders=[("I", "II", "III"), ("III", "I", "II")], reflectors=["B"]).save(path)
+    matches = ZygalskiSheets.open(path).stack(messages)
+    assert SheetMatch(("III", "I", "II"), "B", (2, 5, 11)) in matches
+    assert {m.rotors for m in matches} == {("III", "I", "II")}
+
+def test_banburismus_ranks_true_offsets_first():
+    """Test that messages on the same key stream score highest at their true offset."""
+    from app.api.challenges import CHALLENGES
+    from app.cryptanalysis.banburismus import rank_offsets
+
+    text = ' '.join(c["info"] for c in CHALLENGES)
+    ciphertexts = [
+        make_machine(["II", "IV", "V"], [3, 2, 0], [0, 0, 0]).encrypt_message(text[6000:6600]),
+        make_machine(["I", "II", "III"], [7, 1, 4], [0, 0, 0]).encrypt_message(text[:600]),
+        make_machine(["II", "IV", "V"], [3, 2, 2], [0, 0, 0]).encrypt_message(text[7400:8000]),
+    ]
+    best = rank_offsets(ciphertexts, top=3)[0]
+    assert (best.first, best.second, best.offset) == (0, 2, 2)
+    assert best.decibans > 20
+
+@pytest.mark.parametrize("challenge_id", [2, 3, 7, 9])
+def test_challenge_solver_uses_public_settings(challenge_id):
+    """Test that the constrained solver recovers challenges from their public settings."""
+    from app.api.challenges import CHALLENGES
+    from app.cryptanalysis.challenge_solver import solve_challenge
+
+    challenge = next(c for c in CHALLENGES if c["id"] == challenge_id)
+    solution = solve_challenge(challenge_id)
+    assert solution.plaintext.upper() == challenge["solution"].upper()
+    free_positions = sum(r["position"] is None for r in challenge["settings_public"]["rotors"])
+    assert solution.keys_tested["positions"] >= 26 ** free_positions
+
+def test_keyspace_shards_resume_from_checkpoint(tmp_path):
+    """Test that shards partition the keyspace and an interrupted shard resumes from its checkpoint."""
+    from app.cryptanalysis.keyspace import Checkpoint, FileCoordinator, Keyspace, run_worker, search_range
+
+    keyspace = Keyspace(orders=[("I", "II", "III"), ("III", "II", "I")], reflectors=["B"],
+                        ring_settings=[(0, 0, 0), (0, 0, 5)])
+    assert keyspace.size == 4 * 26 ** 3
+    key = keyspace.encode(1, 0, 1, 1234)
+    assert keyspace.decode(key) == (1, 0, 1, 1234)
+    shards = [keyspace.shard(i, 7) for i in range(7)]
+    assert shards[0][0] == 0 and shards[-1][1] == keyspace.size
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+
+    machine = make_machine(["III", "II", "I"], [2, 7, 20], [0, 0, 5])
+    ciphertext = machine.encrypt_message("WEATHER REPORT FOR THE NORTH SEA WIND FROM THE WEST RAIN LATER")
+
+    # An interrupted run leaves a checkpoint part way through the range
+    path = str(tmp_path / "shard.json")
+    start, end = keyspace.shard(1, 2)
+    partial = search_range(ciphertext, keyspace, start, start + 1000, path, checkpoint_interval=0)
+    Checkpoint(partial.fingerprint, start, end, partial.next_key, partial.keys_tested, partial.best).save(path)
+    resumed = search_range(ciphertext, keyspace, start, end, path, checkpoint_interval=0)
+    assert resumed.keys_tested == end - start
+    assert Checkpoint.load(path).done
+
+    coordinator = FileCoordinator(str(tmp_path / "work"), 3)
+    assert run_worker(ciphertext, keyspace, coordinator, "test") == 3
+    assert coordinator.claim("late") is None
+    best = coordinator.results(1)[0]
+    assert (best.rotors, best.positions, best.ring_settings) == (("III", "II", "I"), (2, 7, 20), (0, 0, 5))
+
+def test_equivalent_settings_share_a_representative():
+    """Test that canonical settings encrypt identically and the class search finds them."""
+    import random
+    from app.cryptanalysis.challenge_solver import default_scorer
+    from app.cryptanalysis.equivalence import canonicalize, class_count, search_classes
+
+    text = "THE ENIGMA MACHINE WAS USED BY THE GERMAN ARMED FORCES"
+    rng = random.Random(0)
+    for _ in range(50):
+        order = tuple(rng.sample(["I", "II", "III", "IV", "V"], 3))
+        length = rng.randint(1, 45)
+        positions = [rng.randrange(26) for _ in range(3)]
+        rings = [rng.randrange(26) for _ in range(3)]
+        canonical_positions, canonical_rings = canonicalize(order, positions, rings, length)
+        expected = make_machine(list(order), positions, rings).encrypt_message(text[:length])
+        canonical = make_machine(list(order), list(canonical_positions), list(canonical_rings))
+        assert canonical.encrypt_message(text[:length]) == expected
+    assert class_count(("I", "II", "III"), 20) * 100 < 26 ** 6
+
+    ciphertext = make_machine(["II", "IV", "V"], [3, 17, 9], [5, 12, 20]).encrypt_message(text[:24])  # 20 letters
+    found = search_classes(ciphertext, default_scorer(), orders=[("II", "IV", "V")], reflectors=["B"], top_k=5)
+    expected = canonicalize(("II", "IV", "V"), [3, 17, 9], [5, 12, 20], 20)
+    assert expected in [(c.positions, c.ring_settings) for c in found]
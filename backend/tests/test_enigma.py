@@ -163,4 +163,264 @@ def test_enigma_rotation():
     machine.encrypt_char("A")
     assert machine.rotors[0].current_position == 1
     assert machine.rotors[1].current_position == 5
-    assert machine.rotors[2].current_position == 2 
\ No newline at end of file
+    assert machine.rotors[2].current_position == 2
+
+def _component_encrypt(machine, message):
+    """Reference encryption that walks the component objects letter by letter."""
+    for rotor, pos in zip(machine.rotors, machine._initial_positions):
+        rotor.current_position = pos
+    result = []
+    for char in message:
+        if not char.isalpha():
+            result.append(char)
+            continue
+        machine._rotate_rotors()
+        char = machine.plugboard.encrypt(char)
+        for rotor in machine.rotors:
+            char = rotor.encrypt_forward(char)
+        char = machine.reflector.reflect(char)
+        for rotor in reversed(machine.rotors):
+            char = rotor.encrypt_backward(char)
+        result.append(machine.plugboard.encrypt(char))
+    return ''.join(result)
+
+def test_compiled_engine_matches_components():
+    """Test that the integer-table engine matches the component path."""
+    machine = EnigmaMachine()
+    machine.set_rotors(
+        rotor_names=["IV", "II", "V"],
+        positions=[7, 3, 24],
+        ring_settings=[2, 17, 9]
+    )
+    machine.set_reflector("C")
+    machine.add_plugboard_connection("Q", "W")
+    machine.add_plugboard_connection("E", "T")
+
+    message = "The quick brown fox, jumps over the lazy dog! 1944 " * 40
+    expected = _component_encrypt(machine, message)
+    assert machine.encrypt_message(message) == expected
+
+    # Changing the plugboard must invalidate the compiled engine
+    machine.add_plugboard_connection("A", "Z")
+    expected = _component_encrypt(machine, message)
+    assert machine.encrypt_message(message) == expected
+
+def test_substitution_tables_are_cached_per_configuration():
+    """Test that composite substitution tables are shared and involutive."""
+    first = EnigmaMachine()
+    second = EnigmaMachine()
+    for machine in (first, second):
+        machine.set_rotors(["I", "II", "III"], [0, 0, 0], [1, 2, 3])
+        machine.set_reflector("B")
+        machine.add_plugboard_connection("A", "B")
+    assert first.compiled() is second.compiled()
+
+    table = first.compiled().substitution((5, 17, 25))
+    assert sorted(table) == list(range(26))
+    for i, j in enumerate(table):
+        assert i != j  # No letter encrypts to itself
+        assert table[j] == i  # Enigma is self-reciprocal
+
+    second.add_plugboard_connection("C", "D")
+    assert first.compiled() is not second.compiled()
+
+    # The key is only recomputed after a configuration change, including
+    # changes made through the public attributes
+    key = first._engine_key
+    first.encrypt_char("A")
+    assert first._engine_key is key
+    first.plugboard.add_connection("H", "X")
+    first.reflector = Reflector(name="C", wiring="FVPJIAOYEDRZXWGCTKUQSBNMHL")
+    first.rotors[1].ring_setting = 7
+    expected = _component_encrypt(first, "HELLOWORLD")
+    first.seek(0)
+    assert first.encrypt_message("HELLOWORLD") == expected
+
+def test_jump_ahead_matches_stepping():
+    """Test that jump-ahead positions match key-by-key stepping."""
+    machine = EnigmaMachine()
+    machine.set_rotors(["I", "II", "III"], [25, 3, 20], [0, 0, 0])
+    machine.set_reflector("B")
+    machine.encrypt_message("")
+    expected = [machine._positions()]
+    for _ in range(40000):  # Longer than the stepping period
+        machine.encrypt_char("A")
+        expected.append(machine._positions())
+    for n in (0, 1, 2, 5, 26, 700, 16900, 16905, 40000):
+        assert tuple(machine.positions_after(n)) == expected[n]
+
+def test_encrypt_message_with_offset():
+    """Test encrypting a slice of a message without replaying its start."""
+    machine = EnigmaMachine()
+    machine.set_rotors(["III", "I", "V"], [4, 24, 10], [3, 0, 12])
+    machine.set_reflector("B")
+    machine.add_plugboard_connection("X", "Y")
+
+    message = "ATTACK AT DAWN, HOLD THE BRIDGE. " * 50
+    full = machine.encrypt_message(message)
+    split = 777
+    letters_before = sum(1 for c in message[:split] if c.isalpha())
+    assert machine.encrypt_message(message[split:], offset=letters_before) == full[split:]
+
+def test_parallel_encryption_matches_serial():
+    """Test that chunked process-pool encryption reassembles in order."""
+    from app.enigma import parallel
+
+    machine = EnigmaMachine()
+    machine.set_rotors(["II", "IV", "I"], [1, 2, 3], [4, 5, 6])
+    machine.set_reflector("B")
+    machine.add_plugboard_connection("K", "L")
+    message = "Wetterbericht fuer die Biskaya, 12 Uhr. " * 20000
+    expected = machine.encrypt_message(message)
+    final_positions = machine._positions()
+
+    encrypted, positions = parallel.encrypt_parallel(
+        machine._engine_key, tuple(machine._initial_positions), message, threshold=0
+    )
+    assert encrypted == expected
+    assert positions == final_positions
+
+    # Short messages stay serial through the machine flag
+    assert machine.encrypt_message("HELLO", parallel=True) == machine.encrypt_message("HELLO")
+
+def _stream_machine():
+    machine = EnigmaMachine()
+    machine.set_rotors(["V", "III", "I"], [12, 0, 25], [1, 1, 1])
+    machine.set_reflector("B")
+    machine.add_plugboard_connection("G", "H")
+    return machine
+
+def test_stream_encryptor_text_and_bytes():
+    """Test that streaming encryption carries rotor state across chunks."""
+    import io
+    from app.enigma.stream import StreamEncryptor
+
+    machine = _stream_machine()
+    message = "Funkspruch Nr. 17 – Ölversorgung gesichert. " * 300
+    expected = machine.encrypt_message(message)
+
+    chunks = [message[i:i + 97] for i in range(0, len(message), 97)]
+    assert ''.join(StreamEncryptor(machine).iter_encrypt(chunks)) == expected
+
+    # Byte chunks split inside multi-byte UTF-8 characters
+    data = message.encode("utf-8")
+    byte_chunks = [data[i:i + 5] for i in range(0, len(data), 5)]
+    assert b''.join(StreamEncryptor(machine).iter_encrypt(byte_chunks)) == expected.encode("utf-8")
+
+    # File objects
+    target = io.BytesIO()
+    assert StreamEncryptor(machine).encrypt_file(io.BytesIO(data), target, read_size=1000) == len(data)
+    assert target.getvalue() == expected.encode("utf-8")
+
+@pytest.mark.asyncio
+async def test_stream_encryptor_async():
+    """Test streaming encryption of an async iterable."""
+    from app.enigma.stream import StreamEncryptor
+
+    machine = _stream_machine()
+    message = "ANGRIFF IM MORGENGRAUEN " * 100
+
+    async def chunks():
+        for i in range(0, len(message), 64):
+            yield message[i:i + 64]
+
+    encrypted = [c async for c in StreamEncryptor(machine).aiter_encrypt(chunks())]
+    assert ''.join(encrypted) == machine.encrypt_message(message)
+
+def test_batch_encryption_matches_machine():
+    """Test that the NumPy batch engine matches EnigmaMachine for mixed settings."""
+    from app.enigma.batch import encrypt_texts
+
+    settings = [
+        {"rotors": [{"name": "I", "position": 0, "ring_setting": 0},
+                    {"name": "II", "position": 3, "ring_setting": 0},
+                    {"name": "III", "position": 21, "ring_setting": 0}],
+         "reflector": "B", "plugboard": {"A": "B"}},
+        {"rotors": [{"name": "V", "position": 25, "ring_setting": 7},
+                    {"name": "IV", "position": 8, "ring_setting": 13},
+                    {"name": "II", "position": 3, "ring_setting": 20}],
+         "reflector": "C", "plugboard": {"Q": "Z", "M": "E", "T": "O"}},
+    ]
+    texts = ["Double stepping happens here! " * 30, "short one"]
+    for s, text, encrypted in zip(settings, texts, encrypt_texts(settings, texts)):
+        machine = EnigmaMachine()
+        machine.set_rotors([r["name"] for r in s["rotors"]],
+                           [r["position"] for r in s["rotors"]],
+                           [r["ring_setting"] for r in s["rotors"]])
+        machine.set_reflector(s["reflector"])
+        for a, b in s["plugboard"].items():
+            machine.add_plugboard_connection(a, b)
+        assert encrypted == machine.encrypt_message(text)
+
+def test_permutation_tables_match_batch_engine(tmp_path):
+    """Test that memory-mapped scrambler tables give the same encryption as the batch engine."""
+    import numpy as np
+    from app.enigma.batch import ALL_POSITIONS, encrypt_positions, plugboard_array
+    from app.enigma.engine import compile_config
+    from app.enigma.tables import TABLES_PATH, PermutationTables, _opened, encrypt_table, shared_tables
+
+    path = str(tmp_path / "tables.bin")
+    assert shared_tables(path) is None
+    PermutationTables.build([("II", "IV", "V")], ["B", "C"]).save(path)
+    assert [p.name for p in tmp_path.iterdir()] == ["tables.bin"]  # Written atomically
+    tables = shared_tables(path)  # A file built later is picked up
+    assert isinstance(tables.tables, np.memmap)
+    assert tables.table(("I", "II", "III"), "B") is None
+
+    letters = np.random.default_rng(0).integers(0, 26, 60)
+    plugboard = plugboard_array({"A": "Q", "E": "Z"})
+    expected = encrypt_positions([1, 3, 4], [3, 9, 21], 2, plugboard, ALL_POSITIONS, letters)
+    actual = encrypt_table(tables.table(("II", "IV", "V"), "C"), [1, 3, 4], [3, 9, 21], plugboard, ALL_POSITIONS, letters)
+    assert (actual == expected).all()
+
+    # The compiled engine composes its substitutions from the shared table
+    def make_table_machine():
+        machine = EnigmaMachine()
+        machine.set_rotors(["II", "IV", "V"], [3, 17, 9], [5, 12, 20])
+        machine.set_reflector("C")
+        machine.add_plugboard_connection("A", "Q")
+        return machine
+
+    expected_text = make_table_machine().encrypt_message("THE TABLES ARE SHARED BETWEEN WORKERS")
+    compile_config.cache_clear()
+    _opened[TABLES_PATH] = tables
+    try:
+        machine = make_table_machine()
+        assert machine.compiled().scrambler is not None
+        assert machine.encrypt_message("THE TABLES ARE SHARED BETWEEN WORKERS") == expected_text
+    finally:
+        del _opened[TABLES_PATH]
+        compile_config.cache_clear()
+
+def test_encrypt_buffer_matches_encrypt_message():
+    """Test that byte buffers are encrypted in place or into an output buffer like encrypt_message."""
+    text = "Attack at dawn, 0600 hours! " * 50
+    machine = EnigmaMachine()
+    machine.set_rotors(["II", "IV", "V"], [3, 17, 9], [5, 12, 20])
+    machine.set_reflector("B")
+    machine.add_plugboard_connection("A", "Q")
+    expected = machine.encrypt_message(text)
+    final_positions = [rotor.current_position for rotor in machine.rotors]
+
+    buffer = bytearray(text.encode("ascii"))
+    assert machine.encrypt_buffer(buffer) == sum(c.isalpha() for c in text)
+    assert buffer.decode("ascii") == expected
+    assert [rotor.current_position for rotor in machine.rotors] == final_positions
+
+    out = bytearray(len(text) + 4)
+    machine.encrypt_buffer(memoryview(text.encode("ascii")), out)
+    assert out[:len(text)].decode("ascii") == expected
+
+    tail = bytearray(text[100:].encode("ascii"))
+    machine.encrypt_buffer(tail, offset=sum(c.isalpha() for c in text[:100]))
+    assert tail.decode("ascii") == expected[100:]
+
+    # Buffers of STATE_COUNT bytes or more index the whole stepping cycle instead
+    long_text = text * 20
+    expected = machine.encrypt_message(long_text)
+    buffer = bytearray(long_text.encode("ascii"))
+    machine.encrypt_buffer(buffer)
+    assert buffer.decode("ascii") == expected
+
+    with pytest.raises(TypeError):
+        machine.encrypt_buffer(b"read only")